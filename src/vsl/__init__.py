@@ -23,20 +23,32 @@ import gettext
 
 
 gi.require_version('Gdk', '4.0')
+gi.require_version('GdkPixbuf', '2.0')
 gi.require_version('Gtk', '4.0')
 
 
-from gi.repository import Gtk  # noqa: E402
-
-
 __application__ = 'vsl'
 __author__ = "Itaï BEN YAACOV"
 __author_email__ = "candeb@free.fr"
 __copyright__ = f"Copyright (C) 2023 {__author__} <{__author_email__}>"
 __website__ = 'https://github.com/begnac/vsl'
 
-__license_type__ = Gtk.License.GPL_3_0
+__license__ = "GPL-3.0-or-later"
 __program_name__ = "Very Simple Launcher"
 __version__ = '0.1.1'
 
 gettext.install(__application__)
+
+
+def __getattr__(name):
+    # Importing Gtk takes a while, and is not needed e.g. for --version.
+    if name == '__license_type__':
+        from gi.repository import Gtk
+        return Gtk.License.GPL_3_0
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def print_version():
+    print(_("{program} version {version}").format(program=__program_name__, version=__version__))
+    print(__copyright__)
+    print(_("License: {license}").format(license=__license__))
@@ -20,11 +20,21 @@
 
 import sys
 
-from gi.repository import Gdk
+from . import print_version
 
-from . import app
 
-if Gdk.Display.get_default() is None:
-    print(_("Cannot open display"))
-else:
-    app.App().run(sys.argv)
+# Guarded, since worker processes of scoring.ScoringPool import the main module.
+if __name__ == '__main__':
+    if sys.argv[1:] in (['--version'], ['-V']):
+        # Answered without loading Gtk and the application.
+        print_version()
+        sys.exit(0)
+
+    from gi.repository import Gdk
+
+    from . import app
+
+    if Gdk.Display.get_default() is None:
+        print(_("Cannot open display"))
+    else:
+        app.App().run(sys.argv)
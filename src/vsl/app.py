@@ -18,9 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-import configparser
 import signal
-import os
 
 from gi.repository import GLib
 from gi.repository import GObject
@@ -30,10 +28,12 @@ from gi.repository import Gtk
 
 import gasyncio
 
-from . import __application__, __program_name__, __version__, __copyright__, __license_type__
+from . import __application__, print_version
 from . import ui
 from . import fetchers
 from . import logger
+from . import replay
+from . import stats
 
 
 class Action(Gio.SimpleAction):
@@ -56,6 +56,9 @@ class Action(Gio.SimpleAction):
 class App(gasyncio.GAsyncIOApplicationMixin, Gtk.Application):
     request = GObject.Property(type=str, default='')
 
+    # Seconds between refreshes of the sources while the window is hidden, when running as a service.
+    REFRESH_INTERVAL = 300
+
     def __init__(self):
         super().__init__(application_id=f'begnac.{__application__}', flags=Gio.ApplicationFlags.HANDLES_COMMAND_LINE | Gio.ApplicationFlags.ALLOW_REPLACEMENT)
 
@@ -63,6 +66,13 @@ class App(gasyncio.GAsyncIOApplicationMixin, Gtk.Application):
         self.add_main_option('debug', ord('d'), GLib.OptionFlags.NONE, GLib.OptionArg.NONE, _("Debug messages"), None)
         self.add_main_option('request', ord('r'), GLib.OptionFlags.NONE, GLib.OptionArg.STRING, _("Request text"), None)
         self.add_main_option('clipboard', ord('c'), GLib.OptionFlags.NONE, GLib.OptionArg.NONE, _("Request from clipboard"), None)
+        self.add_main_option('stats', 0, GLib.OptionFlags.NONE, GLib.OptionArg.NONE, _("Collect fetcher statistics"), None)
+        self.add_main_option('record', 0, GLib.OptionFlags.NONE, GLib.OptionArg.STRING, _("Record requests and results to a file"), _("FILE"))
+
+        self.stats = None
+        self.recorder = None
+        self.service = False
+        self.refresh_source = None
 
         self.connect('startup', self.__class__.startup_cb)
         self.connect('shutdown', self.__class__.shutdown_cb)
@@ -80,24 +90,46 @@ class App(gasyncio.GAsyncIOApplicationMixin, Gtk.Application):
 
         self.actions = (
             Action(name='quit', accels=['<Control>q'], activate_cb=lambda app: app.stop()),
-            Action(name='close', accels=['Escape'], activate_cb=lambda app: app.close_window())
+            Action(name='close', accels=['Escape'], activate_cb=lambda app: app.close_window()),
+            Action(name='stats', accels=[], activate_cb=lambda app: app.dump_stats()),
         )
         for action in self.actions:
             action.add_to_app(self)
 
-        config_file = os.path.join(GLib.get_user_config_dir(), __application__)
-        config = configparser.ConfigParser(interpolation=None)
-        if os.path.exists(config_file):
-            config.read_file(open(config_file), source=config_file)
-        self.root_fetcher = fetchers.fetcher_from_config(config)
+        config = fetchers.read_config()
+        deferred = [] if fetchers.base.boolean(config['Root'].get('lazy', 'no')) else None
+        self.root_fetcher = fetchers.fetcher_from_config(config, deferred=deferred, sources=self.recorder.sources if self.recorder is not None else None)
+        if self.stats is not None:
+            self.stats.instrument(self.root_fetcher)
 
-        self.root_fetcher.do_request(self.request)
-        self.connect('notify::request', lambda self_, param: self_.root_fetcher.do_request(self_.request))
+        self.request_cb(None)
+        self.connect('notify::request', self.__class__.request_cb)
         self.window = ui.Window(self, self.root_fetcher)
+        self.window.request_box.stats = self.stats
+        self.window.request_box.recorder = self.recorder
+        self.loader = fetchers.DeferredLoader(deferred or [], self.stats.instrument_built if self.stats is not None else None)
+
+        # Started by D-Bus activation: get everything ready, so that showing the window is all that is left to do later.
+        if self.get_flags() & Gio.ApplicationFlags.IS_SERVICE:
+            self.service = True
+            self.hold()
+            self.loader.load_all()
+            self.window.realize()
+            self.refresh_source = GLib.timeout_add_seconds(self.REFRESH_INTERVAL, self.refresh_cb, priority=GLib.PRIORITY_LOW)
 
     def shutdown_cb(self):
         logger.debug("Shutting down")
 
+        self.loader.cleanup()
+        if self.refresh_source is not None:
+            GLib.source_remove(self.refresh_source)
+            self.refresh_source = None
+
+        if self.stats is not None:
+            self.stats.dump()
+        if self.recorder is not None:
+            self.recorder.close()
+
         self.root_fetcher.cleanup()
         for action in self.actions:
             action.remove_from_app(self)
@@ -105,10 +137,12 @@ class App(gasyncio.GAsyncIOApplicationMixin, Gtk.Application):
 
     def handle_local_options_cb(self, options):
         if options.contains('version'):
-            print(_("{program} version {version}").format(program=__program_name__, version=__version__))
-            print(__copyright__)
-            print(__license_type__)
+            print_version()
             return 0
+        if options.contains('stats'):
+            self.stats = stats.Stats()
+        if options.contains('record'):
+            self.recorder = replay.Recorder(options.lookup_value('record').get_string())
         return -1
 
     def command_line_cb(self, command_line):
@@ -130,6 +164,22 @@ class App(gasyncio.GAsyncIOApplicationMixin, Gtk.Application):
         except GLib.GError:
             pass
 
+    def request_cb(self, param):
+        if self.stats is not None:
+            self.stats.new_request()
+        if self.recorder is not None:
+            self.recorder.request(self.request)
+        self.root_fetcher.do_request(self.request)
+
+    def refresh_cb(self):
+        # An exception would remove the source.
+        if not self.window.get_visible():
+            try:
+                self.root_fetcher.refresh()
+            except Exception as error:
+                logger.warning(f'Refreshing failed: {error!r}')
+        return GLib.SOURCE_CONTINUE
+
     def activate_cb(self):
         self.window.present()
 
@@ -137,8 +187,17 @@ class App(gasyncio.GAsyncIOApplicationMixin, Gtk.Application):
         self.request = request
         self.window.focus_request()
 
+    def dump_stats(self):
+        if self.stats is None:
+            logger.info(_("Statistics are only collected when started with --stats"))
+        else:
+            self.stats.dump()
+
     def close_window(self):
         self.window.set_visible(False)
 
     def stop(self):
+        if self.service:
+            self.service = False
+            self.release()
         self.window.close()
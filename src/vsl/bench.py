@@ -0,0 +1,451 @@
+# coding: utf-8
+#
+# Very Simple Launcher
+#
+# Copyright (C) Itaï BEN YAACOV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Headless benchmarks of the fetcher pipeline, printing JSON results:
+    python3 -m vsl.bench [--scenario NAME]... [--sizes N,N...] [--output FILE]
+
+Synthetic trees are built like fetcher_from_config() would, a mux of prefixed scored leaves,
+and request sequences are replayed through do_request(), the main context being run until idle,
+and the root being iterated as the window would.  Nothing is displayed.
+"""
+
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+from gi.repository import GLib
+
+from . import __version__
+from . import items
+from . import scoring
+from .fetchers import base
+
+
+WORDS = ('src', 'lib', 'home', 'user', 'share', 'doc', 'icons', 'config', 'configuration', 'python3', 'firefox',
+         'library', 'test', 'main', 'vsl', 'build', 'cache', 'local', 'README', 'Makefile', 'notes.tex', 'setup.py')
+
+SESSIONS = {
+    # Typing a word.
+    'typing': ['c', 'co', 'con', 'conf', 'confi', 'config', 'configu', 'configur', 'configura', 'configurat', 'configurati', 'configuratio', 'configuration'],
+    # Typing, going back and typing something else.
+    'backspace': ['l', 'li', 'lib', 'libr', 'libra', 'librar', 'library', 'librar', 'libra', 'libr', 'lib', 'lib/', 'lib/p', 'lib/py', 'lib/pyt', 'lib/pyth'],
+    # Switching between prefixes.
+    'prefix': ['.', '.a', '.a ', '.a t', '.a te', '.a tex', '.b tex', '.c tex', '.c', '.', '', 't', 'te', 'tex'],
+}
+
+LEAVES = 3
+
+
+def paths(count, seed=0):
+    generator = random.Random(seed)
+    return ['/' + '/'.join(generator.choice(WORDS) for i in range(generator.randint(2, 7))) for i in range(count)]
+
+
+def pump():
+    "Run the idle callbacks, where coalesced changes are flushed."
+    context = GLib.MainContext.default()
+    while context.pending():
+        context.iteration(False)
+
+
+class UnscoredLeaf(base.FetcherColumnLeaf):
+    def __init__(self, name, paths):
+        super().__init__(name, 'text-x-generic')
+        self.append_rows((os.path.basename(path), path, 0.0, None) for path in paths)
+
+    def make_item(self, name, detail, extra):
+        return items.ItemBase(name=name, detail=detail)
+
+
+SyntheticLeaf = base.score(UnscoredLeaf)
+
+
+class RebuildingTop(base.FetcherTop):
+    "FetcherTop as it was before it kept a heap, sorting everything upstream again on every change."
+
+    def fetcher_changed(self, appended=None):
+        self.top = sorted(self.fetcher, key=lambda pair: pair[1], reverse=True)[:self.size]
+        self.changed()
+
+
+def scored(leaf, refine_cut=0.2, top=base.FetcherTop):
+    "The pipes base.score() puts after `leaf`, with `refine_cut` and `top` in place of its own."
+    return base.FetcherScoreDecay(top(base.FetcherMinScore(base.FetcherScoreItems(leaf, refine_cut=refine_cut), score=0.2), size=10), factor=0.8)
+
+
+@base.score
+class SyntheticListLeaf(base.FetcherLeaf):
+    def __init__(self, name, paths):
+        super().__init__(name, 'text-x-generic')
+        self.append_items((items.ItemBase(name=os.path.basename(path), detail=path), 0.0) for path in paths)
+
+
+def tree(size, leaf_class=SyntheticLeaf):
+    "Mux of LEAVES leaves, with prefixes a, b, c..., sharing `size` items."
+    leaves = [leaf_class(f'Leaf {i}', paths(size // LEAVES, seed=i)) for i in range(LEAVES)]
+    return base.FetcherTop(base.FetcherMux(base.FetcherPrefix(leaf, chr(ord('a') + i)) for i, leaf in enumerate(leaves)))
+
+
+def summary(samples):
+    samples = sorted(samples)
+    return {
+        'mean': sum(samples) / len(samples),
+        'p50': samples[len(samples) // 2],
+        'p95': samples[min(len(samples) - 1, len(samples) * 95 // 100)],
+        'max': samples[-1],
+    }
+
+
+def measure_memory(function):
+    "Run `function` under tracemalloc, returning its result and the memory it kept and peaked at, in KiB."
+    tracemalloc.start()
+    try:
+        start, _peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = function()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {'kept_kib': (current - start) / 1024, 'peak_kib': (peak - start) / 1024}
+
+
+def replay(root, requests):
+    "Per request latency in milliseconds, of the request and the iteration of the results."
+    latencies = []
+    for request in requests:
+        start = time.perf_counter()
+        root.do_request(request)
+        pump()
+        list(root)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def bench_session(size, repeat):
+    results = []
+    for name, requests in SESSIONS.items():
+        root = tree(size)
+        pump()
+        latencies = []
+        for i in range(repeat):
+            root.do_request('')
+            pump()
+            latencies.extend(replay(root, requests))
+        _result, memory = measure_memory(lambda: replay(root, requests))
+        results.append({'session': name, 'requests': len(requests), 'latency_ms': summary(latencies), **memory})
+        root.cleanup()
+    return results
+
+
+def bench_build(size, repeat):
+    "Building the tree, with column and list leaves."
+    results = []
+    for name, leaf_class in (('columns', SyntheticLeaf), ('list', SyntheticListLeaf)):
+        times = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            root = tree(size, leaf_class)
+            pump()
+            times.append((time.perf_counter() - start) * 1000)
+            root.cleanup()
+        root, memory = measure_memory(lambda: tree(size, leaf_class))
+        root.cleanup()
+        results.append({'leaf': name, 'build_ms': summary(times), **memory})
+    return results
+
+
+def bench_scorer(size, repeat):
+    "scoring.Scorer against score_string() on the same keys."
+    keys = [path.lower() for path in paths(size)]
+    results = []
+    for request in ('conf', 'lib/py', 'xyz'):
+        baseline = []
+        scorer = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            [scoring.score_string(request, key) for key in keys]
+            baseline.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            s = scoring.Scorer(request)
+            [s(key) for key in keys]
+            scorer.append((time.perf_counter() - start) * 1000)
+        results.append({'request': request, 'score_string_ms': summary(baseline), 'scorer_ms': summary(scorer)})
+    return results
+
+
+def bench_refine(size, repeat):
+    "The sessions on a single leaf scored as base.score() does, with and without refinement."
+    results = []
+    for name, requests in SESSIONS.items():
+        for refine_cut in (0.2, None):
+            root = scored(UnscoredLeaf('Refine', paths(size)), refine_cut)
+            latencies = []
+            for i in range(repeat):
+                root.do_request('')
+                pump()
+                latencies.extend(replay(root, requests))
+            results.append({'session': name, 'refine_cut': refine_cut, 'latency_ms': summary(latencies)})
+            root.cleanup()
+    return results
+
+
+def bench_streaming(size, repeat):
+    """
+    Rows appended by batches of 256 to a scored leaf while a request is active, as locate does,
+    with the top kept in a heap, and rebuilt from scratch on every change.
+    """
+    rows = [(os.path.basename(path), path, 0.0, None) for path in paths(size)]
+    results = []
+    for name, top in (('heap', base.FetcherTop), ('rebuild', RebuildingTop)):
+        times = []
+        for i in range(repeat):
+            leaf = UnscoredLeaf('Streaming', [])
+            root = top(base.FetcherMux([base.FetcherPrefix(scored(leaf, top=top), 'a')]))
+            root.do_request('conf')
+            pump()
+            start = time.perf_counter()
+            for j in range(0, len(rows), 256):
+                leaf.append_rows(rows[j:j + 256])
+                pump()
+            list(root)
+            times.append((time.perf_counter() - start) * 1000)
+            root.cleanup()
+        results.append({'top': name, 'batch': 256, 'append_ms': summary(times)})
+    return results
+
+
+def bench_rules(size, repeat):
+    "Locate's compiled exclude and bonus rules."
+    from .fetchers import misc
+    exclude = '~$ .aux$ .gpg$ /.mozilla/'.split()
+    bonus = {'.tex$': '+1', '/src/': '0.2', r'\.py$': '0.1'}
+    located = paths(size)
+    results = []
+    for name, rules in (('exclude', misc._LocateRules(exclude, {})), ('exclude+bonus', misc._LocateRules(exclude, bonus))):
+        times = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            [rules.score(path) for path in located]
+            times.append((time.perf_counter() - start) * 1000)
+        results.append({'rules': name, 'score_ms': summary(times)})
+    return results
+
+
+def bench_locate(size, repeat):
+    "Searching a synthetic mlocate database directly, as FetcherLocate does with `database` set, and by running locate on it."
+    from .fetchers import locatedb
+    directories = {}
+    for path in paths(size):
+        directory, name = os.path.split(path)
+        directories.setdefault(directory, set()).add(name)
+    results = []
+    with tempfile.TemporaryDirectory() as temporary:
+        database_path = os.path.join(temporary, 'mlocate.db')
+        locatedb.write_mlocate(database_path, [(directory, [(name, False) for name in sorted(names)]) for directory, names in sorted(directories.items())])
+        database = locatedb.LocateDatabase(database_path)
+        for request in ('conf', 'lib/py', 'xyz'):
+            direct = []
+            command = []
+            status = None
+            for i in range(repeat):
+                start = time.perf_counter()
+                list(database.search(request))
+                direct.append((time.perf_counter() - start) * 1000)
+                if status is None:
+                    start = time.perf_counter()
+                    try:
+                        process = subprocess.run(['locate', '-i', '-d', database_path, '--', request], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                    except FileNotFoundError:
+                        status = 'missing'
+                        continue
+                    command.append((time.perf_counter() - start) * 1000)
+                    # 1 just means nothing was found.
+                    if process.returncode not in (0, 1):
+                        status = process.returncode
+            result = {'request': request, 'database_ms': summary(direct)}
+            if status is None:
+                result['locate_ms'] = summary(command)
+            else:
+                result['locate_status'] = status
+            results.append(result)
+        database.close()
+    return results
+
+
+def png(size, seed=0):
+    "A size x size RGB PNG image of noise."
+    generator = random.Random(seed)
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    rows = b''.join(b'\0' + bytes(generator.randrange(256) for i in range(3 * size)) for j in range(size))
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0)) + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b'')
+
+
+def write_firefox_profile(directory, size):
+    "places.sqlite and favicons.sqlite with `size` bookmarks, with the tables and columns FetcherFirefoxBookmarks uses."
+    images = [png(16, seed) for seed in range(8)] + [png(128, seed) for seed in range(4)]
+    urls = [f'https://example{i % 97}.org{path}?{i}' for i, path in enumerate(paths(size))]
+    with sqlite3.connect(os.path.join(directory, 'places.sqlite')) as db:
+        db.execute('CREATE TABLE moz_places (id INTEGER PRIMARY KEY, url TEXT, url_hash INTEGER)')
+        db.execute('CREATE TABLE moz_bookmarks (id INTEGER PRIMARY KEY, fk INTEGER, parent INTEGER, title TEXT)')
+        db.executemany('INSERT INTO moz_places VALUES (?, ?, ?)', ((i, url, zlib.crc32(url.encode())) for i, url in enumerate(urls)))
+        db.executemany('INSERT INTO moz_bookmarks VALUES (?, ?, 2, ?)', ((i, i, os.path.basename(url)) for i, url in enumerate(urls)))
+    with sqlite3.connect(os.path.join(directory, 'favicons.sqlite')) as db:
+        db.execute('CREATE TABLE moz_icons (id INTEGER PRIMARY KEY, icon_url TEXT, width INTEGER, expire_ms INTEGER, data BLOB)')
+        db.execute('CREATE TABLE moz_pages_w_icons (id INTEGER PRIMARY KEY, page_url TEXT, page_url_hash INTEGER)')
+        db.execute('CREATE TABLE moz_icons_to_pages (page_id INTEGER, icon_id INTEGER)')
+        db.execute('CREATE INDEX moz_pages_w_icons_urlhashindex ON moz_pages_w_icons (page_url_hash)')
+        # Pages of the same site share its icons, a small and a large one, and one page in four has none.
+        db.executemany('INSERT INTO moz_icons VALUES (?, ?, ?, 0, ?)', ((i, f'https://example{i // 2}.org/favicon{i % 2}.ico', 16 if i % 2 == 0 else 128, images[i % len(images)]) for i in range(2 * 97)))
+        pages = [(i, url, zlib.crc32(url.encode())) for i, url in enumerate(urls) if i % 4]
+        db.executemany('INSERT INTO moz_pages_w_icons VALUES (?, ?, ?)', pages)
+        db.executemany('INSERT INTO moz_icons_to_pages VALUES (?, ?)', ((i, 2 * (i % 97) + j) for i, url, url_hash in pages for j in range(2)))
+
+
+async def firefox_setup():
+    from .fetchers import firefox
+    root = firefox.FetcherFirefoxBookmarks()
+    leaf = root
+    while not isinstance(leaf, base.FetcherColumnLeaf):
+        leaf = leaf.fetcher
+    start = time.perf_counter()
+    await leaf.task
+    elapsed = (time.perf_counter() - start) * 1000
+    rows = len(leaf.rows)
+    root.cleanup()
+    return elapsed, rows
+
+
+def bench_firefox(size, repeat):
+    "FetcherFirefoxBookmarks.setup() on a synthetic profile, with the favicon cache empty, and filled by the previous run."
+    from . import favicons
+    from .fetchers import firefox
+    results = []
+    with tempfile.TemporaryDirectory() as temporary:
+        write_firefox_profile(temporary, size)
+        saved = firefox._FirefoxInfo.profile_path, favicons.cache.directory
+        firefox._FirefoxInfo.profile_path = temporary
+        try:
+            for cache in ('cold', 'warm'):
+                if cache == 'warm':
+                    favicons.cache.directory = os.path.join(temporary, 'favicons')
+                    asyncio.run(firefox_setup())
+                times = []
+                for i in range(repeat):
+                    if cache == 'cold':
+                        favicons.cache.directory = os.path.join(temporary, f'favicons-{i}')
+                    elapsed, rows = asyncio.run(firefox_setup())
+                    times.append(elapsed)
+                results.append({'favicon_cache': cache, 'bookmarks': rows, 'setup_ms': summary(times)})
+        finally:
+            firefox._FirefoxInfo.profile_path, favicons.cache.directory = saved
+    return results
+
+
+STARTUP_TREE = """
+import asyncio, sys
+from vsl import fetchers
+async def main():
+    fetchers.fetcher_from_config(fetchers.read_config(), deferred=[] if sys.argv[1] == 'lazy' else None)
+asyncio.run(main())
+"""
+
+
+def bench_startup(size, repeat):
+    "Cold start, in fresh interpreters: --version, importing the application, and building the configured tree eagerly or lazily."
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__))), os.environ.get('PYTHONPATH', '')]))
+    commands = {
+        'version': ['-m', 'vsl', '--version'],
+        'import_app': ['-c', 'import vsl.app'],
+        'tree_eager': ['-c', STARTUP_TREE, 'eager'],
+        'tree_lazy': ['-c', STARTUP_TREE, 'lazy'],
+    }
+    results = []
+    for name, command in commands.items():
+        times = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            process = subprocess.run([sys.executable, *command], env=env, stdout=subprocess.DEVNULL)
+            times.append((time.perf_counter() - start) * 1000)
+            if process.returncode != 0:
+                results.append({'command': name, 'status': process.returncode})
+                break
+        else:
+            results.append({'command': name, 'wall_ms': summary(times)})
+    return results
+
+
+SCENARIOS = {
+    'session': bench_session,
+    'build': bench_build,
+    'scorer': bench_scorer,
+    'refine': bench_refine,
+    'streaming': bench_streaming,
+    'rules': bench_rules,
+    'locate': bench_locate,
+    'firefox': bench_firefox,
+    'startup': bench_startup,
+}
+
+# Scenarios not depending on the number of items, run once.
+UNSIZED = {'startup'}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python3 -m vsl.bench', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help="scenario to run, all by default, may be repeated")
+    parser.add_argument('--sizes', default='100,1000,10000,100000', help="comma-separated numbers of items")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per measurement")
+    parser.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout, help="where to write the JSON results")
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in args.scenario or SCENARIOS:
+        for size in [None] if name in UNSIZED else map(int, args.sizes.split(',')):
+            print(f'{name} {size}', file=sys.stderr)
+            for result in SCENARIOS[name](size, args.repeat):
+                results.append({'scenario': name, 'size': size, **result})
+    json.dump({
+        'version': __version__,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'results': results,
+    }, args.output, indent=2)
+    args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
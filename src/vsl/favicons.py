@@ -0,0 +1,118 @@
+# coding: utf-8
+#
+# Very Simple Launcher
+#
+# Copyright (C) Itaï BEN YAACOV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from gi.repository import GLib
+from gi.repository import GdkPixbuf
+
+import os
+import hashlib
+
+from . import __application__
+from . import logger
+from .fetchers import base
+
+
+# Items are shown at Gtk.IconSize.LARGE (32 pixels), keep enough for a scale factor of 2.
+SIZE = 64
+
+
+def scale(data, size=SIZE):
+    "Return the image `data` downscaled to fit in size x size, as PNG, or unchanged if it is small enough or not understood."
+    loader = GdkPixbuf.PixbufLoader()
+    try:
+        loader.write(data)
+        loader.close()
+    except GLib.Error:
+        return data
+    pixbuf = loader.get_pixbuf()
+    width = pixbuf.get_width()
+    height = pixbuf.get_height()
+    if max(width, height) <= size:
+        return data
+    factor = size / max(width, height)
+    pixbuf = pixbuf.scale_simple(max(1, round(width * factor)), max(1, round(height * factor)), GdkPixbuf.InterpType.BILINEAR)
+    success, buffer = pixbuf.save_to_bufferv('png', [], [])
+    return buffer if success else data
+
+
+class FaviconCache:
+    """
+    Favicons downscaled by scale(), stored under the user cache directory.
+
+    An entry is keyed by the icon's url together with a stamp telling its version in the browser database,
+    and storing a new version of an icon removes the previous ones.
+    """
+
+    def __init__(self, size=SIZE):
+        self.size = size
+        self.directory = os.path.join(GLib.get_user_cache_dir(), __application__, 'favicons')
+
+    def path(self, url, stamp):
+        return os.path.join(self.directory, hashlib.sha1(url.encode()).hexdigest(), f'{stamp}-{self.size}.png')
+
+    def load(self, url, stamp):
+        try:
+            with open(self.path(url, stamp), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def store(self, url, stamp, data):
+        data = scale(data, self.size)
+        path = self.path(url, stamp)
+        directory, name = os.path.split(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            for old in os.listdir(directory):
+                if old != name:
+                    os.unlink(os.path.join(directory, old))
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(path + '.tmp', path)
+        except OSError as error:
+            logger.debug(f'Cannot cache favicon {url}: {error}')
+        return data
+
+    def load_many(self, icons):
+        found = {}
+        for key, (url, stamp) in icons.items():
+            data = self.load(url, stamp)
+            if data is not None:
+                found[key] = data
+        return found
+
+    def store_many(self, icons, raw):
+        return {key: self.store(*icons[key], data) for key, data in raw.items() if data is not None}
+
+    async def get_many(self, icons, fetch):
+        """
+        `icons` maps keys (typically database ids) to (url, stamp).
+        For those not in the cache, `await fetch(keys)` should return a mapping from these keys to the raw icon data.
+        Returns a mapping from keys to scaled data.  File access and scaling are done in the thread pool shared with the fetchers.
+        """
+        found = await base.run_in_thread(self.load_many, icons)
+        missing = [key for key in icons if key not in found]
+        if missing:
+            raw = await fetch(missing)
+            found.update(await base.run_in_thread(self.store_many, icons, raw))
+        return found
+
+
+cache = FaviconCache()
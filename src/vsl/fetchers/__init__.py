@@ -18,12 +18,38 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from gi.repository import GLib
+
+import configparser
+import functools
 import importlib
+import os
 
 from . import base
+from .. import __application__
+from .. import logger
+
+
+def read_config(config_file=None):
+    "The configuration, by default from the user configuration directory."
+    if config_file is None:
+        config_file = os.path.join(GLib.get_user_config_dir(), __application__)
+    config = configparser.ConfigParser(interpolation=None)
+    if os.path.exists(config_file):
+        with open(config_file) as f:
+            config.read_file(f, source=config_file)
+    return config
+
 
+def fetcher_from_config(config, name='Root', deferred=None, sources=None, stand_in=None):
+    """
+    Build the fetcher of section `name`.
 
-def fetcher_from_config(config, name='Root'):
+    If `deferred` is a list, imported fetchers are not built but stood for by base.FetcherDeferred instances,
+    which are added to it as (priority, fetcher) pairs.
+    If `sources` is a dictionary, the fetcher of each imported section is added to it by section name.
+    If `stand_in` is given, imported sections are built by stand_in(section name) instead.
+    """
     section = config[name]
     nameargs = f'{name}.args'
     if config.has_section(nameargs):
@@ -34,9 +60,66 @@ def fetcher_from_config(config, name='Root'):
         if namesubarg.startswith(nameargs + '.'):
             args[namesubarg[len(nameargs) + 1:]] = dict(config[namesubarg])
     if section['type'] == 'mux':
-        fetchers = (base.FetcherPrefix(fetcher_from_config(config, name), prefix) for prefix, name in config[f'{name}.mux'].items())
-        return base.FetcherTop(base.FetcherMux(fetchers, **args))
+        fetchers = (base.FetcherPrefix(fetcher_from_config(config, name, deferred, sources, stand_in), prefix) for prefix, name in config[f'{name}.mux'].items())
+        fetcher = base.FetcherTop(base.FetcherMux(fetchers, **args))
     elif section['type'] == 'import':
-        module_name, node_name = section['import'].rsplit('.', 1)
-        module = importlib.import_module(module_name, __name__)
-        return getattr(module, node_name)(**args)
+        if stand_in is not None:
+            factory = functools.partial(stand_in, name)
+        else:
+            factory = functools.partial(import_fetcher, section['import'], args)
+        if deferred is None:
+            fetcher = factory()
+        else:
+            fetcher = base.FetcherDeferred(factory, name)
+            deferred.append((int(section.get('priority', '0')), fetcher))
+        if sources is not None:
+            sources[name] = fetcher
+    if 'debounce' in section:
+        fetcher = base.FetcherDebounce(fetcher, section['debounce'])
+    return fetcher
+
+
+def import_fetcher(import_name, args):
+    module_name, node_name = import_name.rsplit('.', 1)
+    module = importlib.import_module(module_name, __name__)
+    return getattr(module, node_name)(**args)
+
+
+class DeferredLoader:
+    """
+    Loads the base.FetcherDeferred instances gathered by fetcher_from_config(), one per idle callback of low priority,
+    so that the window gets shown and drawn first.  Those with the lowest priority value are loaded first.
+    `built`, if given, is passed on to their load().
+    """
+
+    def __init__(self, deferred, built=None):
+        self.queue = [fetcher for priority, fetcher in sorted(deferred, key=lambda pair: pair[0])]
+        self.built = built
+        self.source = GLib.idle_add(self.idle_cb, priority=GLib.PRIORITY_LOW) if self.queue else None
+
+    def cleanup(self):
+        if self.source is not None:
+            GLib.source_remove(self.source)
+            self.source = None
+        self.queue = []
+
+    def load(self, fetcher):
+        # A fetcher failing to build should not keep the others from loading.
+        try:
+            fetcher.load(self.built)
+        except Exception as error:
+            logger.warning(f'Loading {fetcher.name} failed: {error!r}')
+
+    def idle_cb(self):
+        self.load(self.queue.pop(0))
+        if self.queue:
+            return GLib.SOURCE_CONTINUE
+        self.source = None
+        return GLib.SOURCE_REMOVE
+
+    def load_all(self):
+        "Load what is left right away."
+        queue = self.queue
+        self.cleanup()
+        for fetcher in queue:
+            self.load(fetcher)
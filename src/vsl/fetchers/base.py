@@ -18,8 +18,18 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from gi.repository import GLib
+
+import array
+import asyncio
+import concurrent.futures
+import functools
+import heapq
+
+from .. import __application__
 from .. import items
 from .. import logger
+from .. import scoring
 
 
 def chain(pipe, *cargs, **ckwargs):
@@ -31,9 +41,9 @@ def chain(pipe, *cargs, **ckwargs):
 
 
 def score(old):
-    old = chain(FetcherScoreItems)(old)
-    old = chain(FetcherMinScore)(old)
-    old = chain(FetcherTop)(old)
+    old = chain(FetcherScoreItems, refine_cut=0.2)(old)
+    old = chain(FetcherMinScore, score=0.2)(old)
+    old = chain(FetcherTop, size=10)(old)
     old = chain(FetcherScoreDecay, factor=0.8)(old)
     return old
 
@@ -43,11 +53,37 @@ def nonempty(old):
     return old
 
 
+def boolean(value):
+    "Truth value of a configuration string."
+    return value.lower() in ('yes', 'true', 'on', '1')
+
+
+_executor = None
+
+
+def executor():
+    "Thread pool shared by all fetchers for their blocking work."
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix=f'{__application__}-fetcher')
+    return _executor
+
+
+async def run_in_thread(function, *args, **kwargs):
+    "Await function(*args, **kwargs) run in the shared thread pool."
+    return await asyncio.get_running_loop().run_in_executor(executor(), functools.partial(function, *args, **kwargs))
+
+
 class FetcherBase:
+    # Coalescing fetchers hold back their changes and flush them all at once from an idle callback.
+    coalesce = False
+
     def __init__(self):
         self.hooks = []
         self.freeze_count = 0
         self.changed_while_frozen = False
+        self.appended_while_frozen = []
+        self.idle_source = None
 
     def __del__(self):
         logger.debug(f'Deleting fetcher {self}')
@@ -59,22 +95,51 @@ class FetcherBase:
         if self.freeze_count == 0:
             raise RuntimeError
         self.freeze_count -= 1
-        if self.freeze_count == 0 and self.changed_while_frozen:
+        if self.freeze_count == 0:
+            if self.coalesce:
+                self.schedule_flush()
+            else:
+                self.flush()
+
+    def flush(self):
+        if self.changed_while_frozen:
             self.changed_while_frozen = False
+            self.appended_while_frozen = []
             self._changed()
+        elif self.appended_while_frozen:
+            appended, self.appended_while_frozen = self.appended_while_frozen, []
+            self._changed(appended)
 
-    def cleanup(self):
-        pass
+    def schedule_flush(self):
+        if self.idle_source is None and (self.changed_while_frozen or self.appended_while_frozen):
+            self.idle_source = GLib.idle_add(self.idle_flush_cb)
 
-    def changed(self):
+    def idle_flush_cb(self):
+        self.idle_source = None
         if self.freeze_count == 0:
-            self._changed()
-        else:
+            self.flush()
+        return GLib.SOURCE_REMOVE
+
+    def cleanup(self):
+        if self.idle_source is not None:
+            GLib.source_remove(self.idle_source)
+            self.idle_source = None
+
+    def changed(self, appended=None):
+        "If all that happened is that some (item, score) pairs were added at the end, they are passed as `appended`."
+        if self.freeze_count == 0 and not self.coalesce:
+            self._changed(appended)
+            return
+        if appended is None:
             self.changed_while_frozen = True
+        else:
+            self.appended_while_frozen.extend(appended)
+        if self.freeze_count == 0:
+            self.schedule_flush()
 
-    def _changed(self):
+    def _changed(self, appended=None):
         for hook in self.hooks:
-            hook()
+            hook(appended)
 
     def __iter_(self):
         raise NotImplementedError
@@ -82,8 +147,19 @@ class FetcherBase:
     def do_request(self, request):
         raise NotImplementedError
 
+    def cancel(self):
+        "Drop any work still in progress for the current request."
+        pass
+
+    def refresh(self):
+        "Reload what changed at the source since it was loaded.  Called from time to time while the window is hidden."
+        pass
+
 
 class FetcherSource(FetcherBase):
+    # Worker processes FetcherScoreItems should score this source's items in, see scoring.ScoringPool.
+    score_processes = 0
+
     def __init__(self, name, icon):
         super().__init__()
         self.name = name
@@ -91,31 +167,129 @@ class FetcherSource(FetcherBase):
 
 
 class FetcherLeaf(FetcherSource):
-    def __init__(self, name=None, icon=None):
+    """
+    Leaf holding a list of (item, score) pairs.
+
+    Leaves with a fixed set of items can yield them from load() and call start_load().
+    If `threaded`, load() then runs in the shared thread pool, and its pairs are appended from the main loop by batches of LOAD_BATCH.
+    """
+
+    LOAD_BATCH = 256
+
+    def __init__(self, name=None, icon=None, threaded=False):
         super().__init__(name, icon)
         self.data = []
+        self.threaded = threaded
+        self.load_task = None
+
+    def cleanup(self):
+        if self.load_task is not None:
+            self.load_task.cancel()
+            self.load_task = None
+        super().cleanup()
+
+    def load(self):
+        return ()
+
+    def start_load(self):
+        if self.threaded:
+            self.load_task = asyncio.create_task(self.load_in_thread())
+        else:
+            self.append_items(self.load())
+
+    async def load_in_thread(self):
+        task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+
+        def load():
+            batch = []
+            for pair in self.load():
+                batch.append(pair)
+                if len(batch) == self.LOAD_BATCH:
+                    loop.call_soon_threadsafe(self.append_loaded, task, batch)
+                    batch = []
+            return batch
+
+        try:
+            self.append_loaded(task, await run_in_thread(load))
+        finally:
+            if self.load_task is task:
+                self.load_task = None
+
+    def append_loaded(self, task, pairs):
+        if task is self.load_task:
+            self.append_items(pairs)
 
     def do_request(self, request):
         pass
 
+    def clear(self):
+        self.data.clear()
+        self.changed()
+
     def append_item(self, item, score=0.0):
         self.data.append((item, score))
-        self.changed()
+        self.changed([(item, score)])
+
+    def append_items(self, pairs):
+        pairs = list(pairs)
+        if pairs:
+            self.data.extend(pairs)
+            self.changed(pairs)
 
     def __iter__(self):
         yield from self.data
 
 
+class FetcherColumnLeaf(FetcherSource):
+    """
+    Leaf storing its items in an items.ItemColumns instead of a list.
+
+    Meant for large sources: subclasses add rows with append_row() and build the items in make_item().
+    """
+
+    def __init__(self, name=None, icon=None, score_bonus=0.0):
+        super().__init__(name, icon)
+        self.score_bonus = score_bonus
+        self.clear()
+
+    def clear(self):
+        self.rows = items.ItemColumns(self.make_item, self.score_bonus)
+        self.changed()
+
+    def make_item(self, name, detail, extra):
+        raise NotImplementedError
+
+    def do_request(self, request):
+        pass
+
+    def append_row(self, name, detail, score=0.0, extra=None):
+        row = self.rows.append(name, detail, score, extra)
+        self.changed([(row, score)])
+
+    def append_rows(self, rows):
+        "Append (name, detail, score, extra) tuples, notifying once."
+        appended = [(self.rows.append(name, detail, score, extra), score) for name, detail, score, extra in rows]
+        if appended:
+            self.changed(appended)
+
+    def __iter__(self):
+        yield from self.rows
+
+
 class FetcherPipe(FetcherBase):
     def __init__(self, fetcher):
         self.fetcher = fetcher
         super().__init__()
-        fetcher.hooks.append(self.changed)
+        fetcher.hooks.append(self.fetcher_changed)
 
     def cleanup(self):
-        self.fetcher.hooks.remove(self.changed)
+        self.fetcher.hooks.remove(self.fetcher_changed)
         self.fetcher.cleanup()
 
+    def fetcher_changed(self, appended=None):
+        self.changed()
+
     @property
     def name(self):
         return self.fetcher.name
@@ -127,18 +301,136 @@ class FetcherPipe(FetcherBase):
     def do_request(self, request):
         self.fetcher.do_request(request)
 
+    def cancel(self):
+        self.fetcher.cancel()
+
+    def refresh(self):
+        self.fetcher.refresh()
+
+
+class FetcherDeferred(FetcherSource):
+    """
+    Stands for the fetcher returned by `factory`, until load() builds it.
+
+    Until then it has no items, and remembers the last request to pass it on when loaded.
+    """
+
+    def __init__(self, factory, name=None, icon=None):
+        super().__init__(name, icon)
+        self.factory = factory
+        self.fetcher = None
+        self.request = None
+
+    def load(self, built=None):
+        "Build the fetcher, calling built(self) before it gets any request."
+        if self.fetcher is not None:
+            return
+        self.fetcher = self.factory()
+        if built is not None:
+            built(self)
+        self.fetcher.hooks.append(self.fetcher_changed)
+        self.name = self.fetcher.name
+        self.icon = self.fetcher.icon
+        self.freeze()
+        try:
+            if self.request is not None:
+                self.fetcher.do_request(self.request)
+            self.changed()
+        finally:
+            self.thaw()
+
+    def cleanup(self):
+        if self.fetcher is not None:
+            self.fetcher.hooks.remove(self.fetcher_changed)
+            self.fetcher.cleanup()
+        super().cleanup()
+
+    def fetcher_changed(self, appended=None):
+        self.changed(appended)
+
+    def do_request(self, request):
+        self.request = request
+        if self.fetcher is not None:
+            self.fetcher.do_request(request)
+
+    def cancel(self):
+        if self.fetcher is not None:
+            self.fetcher.cancel()
+
+    def refresh(self):
+        if self.fetcher is not None:
+            self.fetcher.refresh()
+
+    def __iter__(self):
+        if self.fetcher is not None:
+            yield from self.fetcher
+
+
+class FetcherDebounce(FetcherPipe):
+    "Passes a request on once it has not changed for `delay` milliseconds, cancelling the work for the one it supersedes."
+
+    def __init__(self, fetcher, delay):
+        self.delay = int(delay)
+        self.timeout_source = None
+        super().__init__(fetcher)
+
+    def cleanup(self):
+        self.remove_timeout()
+        super().cleanup()
+
+    def remove_timeout(self):
+        if self.timeout_source is not None:
+            GLib.source_remove(self.timeout_source)
+            self.timeout_source = None
+
+    def do_request(self, request):
+        self.remove_timeout()
+        self.fetcher.cancel()
+        self.timeout_source = GLib.timeout_add(self.delay, self.timeout_cb, request)
+
+    def timeout_cb(self, request):
+        self.timeout_source = None
+        self.fetcher.do_request(request)
+        return GLib.SOURCE_REMOVE
+
 
 class FetcherTop(FetcherPipe):
+    """
+    Keeps the `size` best pairs in a heap of (score, -position, item),
+    so that appended pairs are merged in without going through the whole upstream again.
+    Ties are broken by position, as a stable sort would.
+    """
+
     def __init__(self, fetcher, size=10):
         self.size = size
+        self.heap = []
+        self.count = 0
         self.top = []
         super().__init__(fetcher)
 
-    def changed(self):
-        self.top = sorted(self.fetcher, key=lambda item: item[1], reverse=True)
-        if len(self.top) > self.size:
-            self.top = self.top[:self.size]
-        super().changed()
+    def push(self, pairs):
+        heap = self.heap
+        pushed = False
+        for item, score in pairs:
+            entry = (score, -self.count, item)
+            self.count += 1
+            if len(heap) < self.size:
+                heapq.heappush(heap, entry)
+                pushed = True
+            elif heap and entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+                pushed = True
+        return pushed
+
+    def fetcher_changed(self, appended=None):
+        if appended is None:
+            self.heap = []
+            self.count = 0
+            self.push(self.fetcher)
+        elif not self.push(appended):
+            return
+        self.top = [(item, score) for score, position, item in sorted(self.heap, reverse=True)]
+        self.changed()
 
     def __iter__(self):
         yield from self.top
@@ -149,6 +441,14 @@ class FetcherMinScore(FetcherPipe):
         self.score = score
         super().__init__(fetcher)
 
+    def fetcher_changed(self, appended=None):
+        if appended is None:
+            self.changed()
+        else:
+            appended = [pair for pair in appended if pair[1] >= self.score]
+            if appended:
+                self.changed(appended)
+
     def __iter__(self):
         return filter(lambda item: item[1] >= self.score, self.fetcher)
 
@@ -171,6 +471,10 @@ class FetcherNonEmpty(FetcherPipe):
                 self.nonempty = False
                 self.changed()
 
+    def fetcher_changed(self, appended=None):
+        if self.nonempty:
+            self.changed(appended)
+
     def __iter__(self):
         if self.nonempty:
             yield from self.fetcher
@@ -189,20 +493,200 @@ class FetcherScoreDecay(FetcherPipe):
 
 
 class FetcherScoreItems(FetcherPipe):
-    def __init__(self, fetcher):
-        self.request = ''
+    """
+    Adds the items' own scores for the current request.
+
+    With refine_cut set, the cut-off applied downstream, items which cannot reach it are left out without being scored.
+    Fuzzy scores are not monotonic, an item scoring badly for a request may score well for its extension
+    ("the" and "the calculator" for "Calculator"), so this relies on scoring.score_bound() instead:
+    the number of request characters missing from each key only grows as the request is extended,
+    and is kept for each request, so that an extension only looks for its new characters.
+    A stack of such generations is kept so that backspacing falls back to the previous one.
+    Any change upstream drops them all.
+    Each request still walks every item to update its counts and check its bound, so it stays linear in the number of items:
+    what is saved is only the SequenceMatcher runs for the items left out.  They cannot be dropped for good either,
+    since the bound is not monotonic: the longer the request, the less each missing character weighs, and a key may come back within reach.
+
+    If the upstream fetcher has score_processes set, scoring is done asynchronously in a scoring.ScoringPool instead,
+    which sends back the POOL_CANDIDATES best items for the request.  Until it does, the candidates of the previous request are shown,
+    rescored for the new one.  A full change upstream drops them, and ships everything again,
+    unless upstream is a FetcherColumnLeaf still holding the same rows: then only the rows updated or added are shipped.
+    """
+
+    POOL_CANDIDATES = 100
+
+    def __init__(self, fetcher, *, refine_cut=None):
+        self.scorer = scoring.Scorer('')
+        self.refine_cut = refine_cut
+        # (request, missing characters of each name key, and of each detail key) for refine_data.
+        self.generations = []
+        self.refine_data = []
+        self.refine_keys = []
+        self.pool = scoring.ScoringPool(fetcher.score_processes) if fetcher.score_processes else None
+        self.pool_task = None
+        self.pool_dirty = False
+        # Pairs not yet shipped to the pool, None if everything should be shipped again.
+        self.pool_pending = None
+        self.pool_shipped = []
+        # The upstream items.ItemColumns shipped, the position in the pool of its rows, how many of them were shipped,
+        # how far its log of updated rows was followed, and the positions to update mapped to their row.
+        self.pool_rows = None
+        self.pool_positions = {}
+        self.pool_columns = 0
+        self.pool_updated = 0
+        self.pool_updates = {}
+        self.candidates = []
         super().__init__(fetcher)
 
+    def cleanup(self):
+        if self.pool is not None:
+            if self.pool_task is not None:
+                self.pool_task.cancel()
+            self.pool.shutdown()
+        super().cleanup()
+
+    def fetcher_changed(self, appended=None):
+        self.generations.clear()
+        self.refine_data = []
+        self.refine_keys = []
+        if self.pool is not None:
+            if appended is None:
+                if not self.pool_follow():
+                    self.pool_pending = None
+                    self.candidates = []
+                    self.changed()
+            elif self.pool_pending is not None:
+                self.pool_pending.extend(appended)
+            self.pool_score()
+        elif appended is None:
+            self.changed()
+        else:
+            scores = self.scorer.score_items(item for item, score in appended)
+            self.changed([(item, score + delta) for (item, score), delta in zip(appended, scores)])
+
     def do_request(self, request):
         self.freeze()
         super().do_request(request)
-        self.request = request
+        self.scorer = scoring.Scorer(request)
+        while self.generations and not self.scorer.request.startswith(self.generations[-1][0]):
+            self.generations.pop()
+        if self.pool is not None:
+            self.pool_score()
         self.changed()
         self.thaw()
 
+    def pool_follow(self):
+        "Queue what changed in the rows already shipped, returning False if everything has to be shipped again."
+        rows = getattr(self.fetcher, 'rows', None)
+        if self.pool_pending is None or rows is None or rows is not self.pool_rows:
+            return False
+        for index in rows.updated[self.pool_updated:]:
+            position = self.pool_positions.get(index)
+            if position is not None:
+                self.pool_updates[position] = index
+        self.pool_updated = len(rows.updated)
+        # Rows added since, whether or not they were notified as appended.
+        self.pool_pending = [rows.pair(index) for index in range(self.pool_columns, len(rows))]
+        return True
+
+    @staticmethod
+    def pool_row(item, score):
+        keys = item.score_keys()
+        return (None, None, item.score_bonus, score) if keys is None else (*keys, item.score_bonus, score)
+
+    def pool_score(self):
+        if self.pool_task is None:
+            self.pool_task = asyncio.create_task(self.pool_run())
+        else:
+            self.pool_dirty = True
+
+    async def pool_run(self):
+        try:
+            while True:
+                self.pool_dirty = False
+                if self.pool_pending is None:
+                    self.pool.reset()
+                    self.pool_shipped = []
+                    self.pool_rows = getattr(self.fetcher, 'rows', None)
+                    self.pool_positions = {}
+                    self.pool_columns = 0
+                    self.pool_updated = len(self.pool_rows.updated) if self.pool_rows is not None else 0
+                    self.pool_updates = {}
+                    pairs = list(self.fetcher)
+                else:
+                    pairs = self.pool_pending
+                self.pool_pending = []
+                rows = self.pool_rows
+                if rows is not None:
+                    # Rows updated since they were notified are shipped as they are now.
+                    pairs = [rows.pair(item.index) if isinstance(item, items.ItemRow) and item.columns is rows else (item, score) for item, score in pairs]
+                    for position, (item, score) in enumerate(pairs, len(self.pool_shipped)):
+                        if isinstance(item, items.ItemRow) and item.columns is rows:
+                            self.pool_positions[item.index] = position
+                            self.pool_columns = max(self.pool_columns, item.index + 1)
+                self.pool_shipped.extend(pairs)
+                self.pool.extend([self.pool_row(item, score) for item, score in pairs])
+                if self.pool_updates:
+                    updates = []
+                    for position, index in self.pool_updates.items():
+                        self.pool_shipped[position] = pair = rows.pair(index)
+                        updates.append((position, *self.pool_row(*pair)))
+                    self.pool_updates = {}
+                    self.pool.update(updates)
+                top = await self.pool.top(self.scorer.request, self.POOL_CANDIDATES)
+                if not self.pool_dirty:
+                    self.candidates = [self.pool_shipped[-minus_index] for score, minus_index in top]
+                    self.changed()
+                    return
+        except concurrent.futures.BrokenExecutor as error:
+            logger.warning(f'Scoring processes of {self.fetcher.name} failed, scoring locally: {error}')
+            self.pool.shutdown()
+            self.pool = None
+            self.changed()
+        finally:
+            self.pool_task = None
+
+    def score_pairs(self, pairs):
+        scores = self.scorer.score_items(item for item, score in pairs)
+        return [(item, score + delta) for (item, score), delta in zip(pairs, scores)]
+
     def __iter__(self):
-        for item, score in self.fetcher:
-            yield item, score + item.score(self.request)
+        if self.pool is not None:
+            yield from self.score_pairs(self.candidates)
+            return
+        request = self.scorer.request
+        if self.refine_cut is None or not request:
+            yield from self.score_pairs(list(self.fetcher))
+            return
+        names, details = self.refine()
+        scorer = self.scorer
+        length = len(request)
+        # Leave some room for rounding.
+        cut = self.refine_cut - 1e-9
+        for (item, score), keys, name_missing, detail_missing in zip(self.refine_data, self.refine_keys, names, details):
+            if keys is None:
+                yield item, score + item.score_bonus
+                continue
+            name, detail = keys
+            if max(scoring.score_bound(length, name, name_missing), scoring.score_bound(length, detail, detail_missing) - 0.05) + item.score_bonus + score >= cut:
+                yield item, score + max(scorer(name), scorer(detail) - 0.05) + item.score_bonus
+
+    def refine(self):
+        "Numbers of request characters missing from each name and detail key, counted from the longest remembered prefix of the request."
+        request = self.scorer.request
+        if not self.generations:
+            self.refine_data = list(self.fetcher)
+            self.refine_keys = [item.score_keys() for item, score in self.refine_data]
+            zeros = array.array('I', bytes(4 * len(self.refine_data)))
+            self.generations.append(('', zeros, zeros))
+        prefix, names, details = self.generations[-1]
+        if prefix != request:
+            suffix = request[len(prefix):]
+            keys = [('', '') if keys is None else keys for keys in self.refine_keys]
+            names = array.array('I', (missing + sum(c not in name for c in suffix) for missing, (name, detail) in zip(names, keys)))
+            details = array.array('I', (missing + sum(c not in detail for c in suffix) for missing, (name, detail) in zip(details, keys)))
+            self.generations.append((request, names, details))
+        return names, details
 
 
 class FetcherPrefix(FetcherPipe):
@@ -256,13 +740,16 @@ class FetcherMux(FetcherSource):
         super().__init__(name, icon)
         self.fetchers = list(fetchers)
         for fetcher in self.fetchers:
-            fetcher.hooks.append(self.changed)
+            fetcher.hooks.append(self.fetcher_changed)
 
     def cleanup(self):
         for fetcher in self.fetchers:
-            fetcher.hooks.remove(self.changed)
+            fetcher.hooks.remove(self.fetcher_changed)
             fetcher.cleanup()
 
+    def fetcher_changed(self, appended=None):
+        self.changed()
+
     def __iter__(self):
         for fetcher in self.fetchers:
             yield from fetcher
@@ -272,3 +759,15 @@ class FetcherMux(FetcherSource):
         for fetcher in self.fetchers:
             fetcher.do_request(request)
         self.thaw()
+
+    def cancel(self):
+        for fetcher in self.fetchers:
+            fetcher.cancel()
+
+    def refresh(self):
+        # A source failing to refresh should not keep the others from doing so.
+        for fetcher in self.fetchers:
+            try:
+                fetcher.refresh()
+            except Exception as error:
+                logger.warning(f'Refreshing {fetcher.name} failed: {error!r}')
@@ -19,7 +19,6 @@
 
 
 from gi.repository import GLib
-from gi.repository import Gdk
 
 import os
 import json
@@ -28,6 +27,7 @@ import aiosqlite
 
 from . import base
 from .. import items
+from .. import favicons
 
 
 class _ChromiumInfo:
@@ -42,15 +42,38 @@ class _ChromiumInfo:
     async def get_favicon_db(cls):
         return await cls.db('Favicons')
 
+    @staticmethod
+    async def get_bitmaps_data(db, bitmap_ids):
+        bitmaps = await db.execute(f'SELECT id, image_data FROM favicon_bitmaps WHERE id IN ({", ".join("?" * len(bitmap_ids))})', bitmap_ids)
+        return dict(await bitmaps.fetchall())
+
+    @classmethod
+    async def get_favicons_from_db(cls, page_urls, db, batch_size=500):
+        "Map each page url having a favicon to its widest one, querying up to batch_size urls at a time."
+        pages = {}
+        bitmaps = {}
+        page_urls = list(dict.fromkeys(page_urls))
+        for start in range(0, len(page_urls), batch_size):
+            batch = page_urls[start:start + batch_size]
+            icons = await db.execute('SELECT page_url, favicon_bitmaps.id, last_updated '
+                                     'FROM favicon_bitmaps '
+                                     'JOIN icon_mapping on favicon_bitmaps.icon_id = icon_mapping.icon_id '
+                                     f'WHERE page_url IN ({", ".join("?" * len(batch))}) '
+                                     'ORDER BY width DESC', batch)
+            async for page_url, bitmap_id, last_updated in icons:
+                if page_url not in pages:
+                    pages[page_url] = bitmap_id
+                    bitmaps[bitmap_id] = (page_url, last_updated)
+        found = {}
+        bitmap_ids = list(bitmaps)
+        for start in range(0, len(bitmap_ids), batch_size):
+            batch = {bitmap_id: bitmaps[bitmap_id] for bitmap_id in bitmap_ids[start:start + batch_size]}
+            found.update(await favicons.cache.get_many(batch, lambda bitmap_ids: cls.get_bitmaps_data(db, bitmap_ids)))
+        return {page_url: items.IconData(found[bitmap_id]) for page_url, bitmap_id in pages.items() if bitmap_id in found}
+
     @classmethod
     async def get_favicon_from_db(cls, favicon, db):
-        icons = await db.execute('SELECT image_data '
-                                 'FROM favicon_bitmaps '
-                                 'JOIN icon_mapping on favicon_bitmaps.icon_id = icon_mapping.icon_id '
-                                 'WHERE page_url = ? '
-                                 'ORDER BY width DESC', (favicon,))
-        async for data, in icons:
-            return Gdk.Texture.new_from_bytes(GLib.Bytes.new_take(data))
+        return (await cls.get_favicons_from_db([favicon], db)).get(favicon)
 
     @classmethod
     async def get_favicon(cls, favicon):
@@ -62,24 +85,52 @@ class _ChromiumInfo:
 
 
 @base.score
-class FetcherChromiumBookmarks(base.FetcherLeaf):
+class FetcherChromiumBookmarks(base.FetcherColumnLeaf):
+    coalesce = True
+
     def __init__(self):
         super().__init__(_("Chromium bookmarks"), 'chromium')
-        asyncio.create_task(self.get_bookmarks())
+        self.mtime = None
+        self.task = asyncio.create_task(self.get_bookmarks())
+
+    @staticmethod
+    def bookmarks_mtime():
+        try:
+            return os.stat(os.path.join(_ChromiumInfo.ROOT, 'Bookmarks')).st_mtime
+        except OSError:
+            return None
+
+    def refresh(self):
+        if self.task.done() and self.bookmarks_mtime() != self.mtime:
+            self.clear()
+            self.task = asyncio.create_task(self.get_bookmarks())
+
+    def make_item(self, name, url, icon):
+        return items.ItemUri(name=name, detail=url, icon=icon)
 
     async def get_bookmarks(self):
-        path = os.path.join(GLib.get_user_config_dir(), 'chromium', 'Default', 'Bookmarks')
-        bookmarks = json.loads(open(path, 'rb').read().decode('utf-8'))
+        self.mtime = self.bookmarks_mtime()
+        bookmarks = await base.run_in_thread(self.read_bookmarks, os.path.join(_ChromiumInfo.ROOT, 'Bookmarks'))
         favicons = await _ChromiumInfo.get_favicon_db()
         try:
-            await self.append_bookmarks(bookmarks['roots'].values(), favicons)
+            icons = await _ChromiumInfo.get_favicons_from_db([url for name, url in bookmarks], favicons)
         finally:
             await favicons.close()
+        self.append_rows((name, url, 0.1, icons.get(url, 'chromium')) for name, url in bookmarks)
 
-    async def append_bookmarks(self, bookmarks, favicons):
-        for bookmark in bookmarks:
-            if bookmark['type'] == 'folder':
-                await self.append_bookmarks(bookmark['children'], favicons)
-            elif bookmark['type'] == 'url':
-                icon = (await _ChromiumInfo.get_favicon_from_db(bookmark['url'], favicons)) or 'chromium'
-                self.append_item(items.ItemUri(name=bookmark['name'], detail=bookmark['url'], title=bookmark['name'], icon=icon), score=0.1)
+    @classmethod
+    def read_bookmarks(cls, path):
+        "Parse the Bookmarks file into a flat list of (name, url).  Blocking, meant to run in a worker thread."
+        with open(path, 'rb') as f:
+            tree = json.load(f)
+        bookmarks = []
+        cls.flatten_bookmarks(tree['roots'].values(), bookmarks)
+        return bookmarks
+
+    @classmethod
+    def flatten_bookmarks(cls, nodes, bookmarks):
+        for node in nodes:
+            if node['type'] == 'folder':
+                cls.flatten_bookmarks(node['children'], bookmarks)
+            elif node['type'] == 'url':
+                bookmarks.append((node['name'], node['url']))
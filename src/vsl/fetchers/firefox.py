@@ -18,9 +18,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from gi.repository import GLib
-from gi.repository import Gdk
-
 import os
 import configparser
 import asyncio
@@ -28,6 +25,7 @@ import aiosqlite
 
 from . import base
 from .. import items
+from .. import favicons
 
 
 class _FirefoxInfo:
@@ -48,53 +46,100 @@ class _FirefoxInfo:
         return cls.profile_path
 
     @classmethod
-    async def db_in_profile(cls, name):
+    def db_mtime(cls, name):
+        """
+        Last modification of a database, or None if there is none.
+
+        Databases are opened immutable, so changes still in the write-ahead log are not seen:
+        they only count once checkpointed into the database.
+        """
+        profile_path = cls.get_profile_path()
+        if profile_path is None:
+            return None
+        try:
+            return os.stat(os.path.join(profile_path, name + '.sqlite')).st_mtime
+        except OSError:
+            return None
+
+    @classmethod
+    def db_uri(cls, name):
         path = os.path.join(cls.get_profile_path(), name)
-        return await aiosqlite.connect(f'file:{path}.sqlite?immutable=1', uri=True)
+        return f'file:{path}.sqlite?immutable=1'
+
+    @classmethod
+    async def db_in_profile(cls, name):
+        return await aiosqlite.connect(cls.db_uri(name), uri=True)
+
+    @staticmethod
+    async def get_icons_data(db, icon_ids):
+        "Works both on favicons.sqlite and on a connection it is attached to."
+        icons = await db.execute(f'SELECT id, data FROM moz_icons WHERE id IN ({", ".join("?" * len(icon_ids))})', icon_ids)
+        return dict(await icons.fetchall())
 
     @classmethod
     async def get_favicon(cls, favicon):
         db = await cls.db_in_profile('favicons')
         try:
-            icons = await db.execute('SELECT data '
+            icons = await db.execute('SELECT id, expire_ms '
                                      'FROM moz_icons '
                                      'WHERE icon_url = ? '
-                                     'ORDER BY moz_icons.width DESC', (favicon,))
-            async for data, in icons:
-                return Gdk.Texture.new_from_bytes(GLib.Bytes.new_take(data))
+                                     'ORDER BY moz_icons.width DESC '
+                                     'LIMIT 1', (favicon,))
+            async for icon_id, expire_ms in icons:
+                found = await favicons.cache.get_many({icon_id: (favicon, expire_ms)}, lambda icon_ids: cls.get_icons_data(db, icon_ids))
+                if icon_id in found:
+                    return items.IconData(found[icon_id])
         finally:
             await db.close()
 
 
 @base.score
-class FetcherFirefoxBookmarks(base.FetcherLeaf):
+class FetcherFirefoxBookmarks(base.FetcherColumnLeaf):
+    coalesce = True
+    CHUNK_SIZE = 256
+
     def __init__(self):
         super().__init__(_("Firefox bookmarks"), 'firefox')
-        asyncio.ensure_future(self.setup())
+        self.mtime = None
+        self.task = asyncio.ensure_future(self.setup())
+
+    def refresh(self):
+        if self.task.done() and _FirefoxInfo.db_mtime('places') != self.mtime:
+            self.clear()
+            self.task = asyncio.ensure_future(self.setup())
+
+    def make_item(self, name, url, icon):
+        return items.ItemUri(name=name, detail=url, title=_("{name} [Firefox]"), icon=icon)
 
     async def setup(self):
-        self.freeze()
-        db1 = await _FirefoxInfo.db_in_profile('places')
-        db2 = await _FirefoxInfo.db_in_profile('favicons')
-        bookmarks = await db1.execute('SELECT bookmarks.title, places.url '
-                                      'FROM moz_bookmarks bookmarks '
-                                      # 'JOIN moz_bookmarks parents ON bookmarks.parent = parents.id AND parents.parent <> 4 '
-                                      'JOIN moz_places places ON bookmarks.fk = places.id')
-        async for title, url in bookmarks:
-            if title is None:
-                title = "THIS SHOULD NOT HAPPEN"
-            icons = await db2.execute('SELECT moz_icons.data '
-                                      'FROM moz_pages_w_icons '
-                                      'JOIN moz_icons_to_pages ON moz_pages_w_icons.id = moz_icons_to_pages.page_id '
-                                      'JOIN moz_icons ON moz_icons_to_pages.icon_id = moz_icons.id '
-                                      'WHERE moz_pages_w_icons.page_url = ? '
-                                      'ORDER BY moz_icons.width DESC', (url,))
-            async for data, in icons:
-                icon = Gdk.Texture.new_from_bytes(GLib.Bytes.new_take(data))
-                break
-            else:
-                icon = 'firefox'
-            self.append_item(items.ItemUri(name=title, detail=url, title=_("{name} [Firefox]"), icon=icon), score=0.1)
-        await db2.close()
-        await db1.close()
-        self.thaw()
+        self.mtime = _FirefoxInfo.db_mtime('places')
+        db = await _FirefoxInfo.db_in_profile('places')
+        try:
+            await db.execute('ATTACH DATABASE ? AS favicons', (_FirefoxInfo.db_uri('favicons'),))
+            # Both url hashes are computed by the same hash() function, so the lookup can use the page_url_hash index.
+            # Icon data is only read for icons missing from the favicon cache.
+            bookmarks = await db.execute('SELECT title, url, icons.id, icons.icon_url, icons.expire_ms '
+                                         'FROM (SELECT bookmarks.title AS title, places.url AS url, '
+                                         '(SELECT icons.id '
+                                         'FROM favicons.moz_pages_w_icons pages '
+                                         'JOIN favicons.moz_icons_to_pages icons_to_pages ON pages.id = icons_to_pages.page_id '
+                                         'JOIN favicons.moz_icons icons ON icons_to_pages.icon_id = icons.id '
+                                         'WHERE pages.page_url_hash = places.url_hash AND pages.page_url = places.url '
+                                         'ORDER BY icons.width DESC LIMIT 1) AS icon_id '
+                                         'FROM moz_bookmarks bookmarks '
+                                         # 'JOIN moz_bookmarks parents ON bookmarks.parent = parents.id AND parents.parent <> 4 '
+                                         'JOIN moz_places places ON bookmarks.fk = places.id) '
+                                         'LEFT JOIN favicons.moz_icons icons ON icons.id = icon_id')
+            while rows := await bookmarks.fetchmany(self.CHUNK_SIZE):
+                icons = {icon_id: (icon_url, expire_ms) for title, url, icon_id, icon_url, expire_ms in rows if icon_id is not None}
+                found = await favicons.cache.get_many(icons, lambda icon_ids: _FirefoxInfo.get_icons_data(db, icon_ids))
+                self.append_rows(self.bookmark_row(title, url, found.get(icon_id)) for title, url, icon_id, icon_url, expire_ms in rows)
+        finally:
+            await db.close()
+
+    @staticmethod
+    def bookmark_row(title, url, data):
+        if title is None:
+            title = "THIS SHOULD NOT HAPPEN"
+        icon = items.IconData(data) if data is not None else 'firefox'
+        return title, url, 0.1, icon
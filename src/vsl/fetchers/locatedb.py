@@ -0,0 +1,188 @@
+# coding: utf-8
+#
+# Very Simple Launcher
+#
+# Copyright (C) Itaï BEN YAACOV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Direct reader for locate databases, through mmap.
+
+Two formats are understood:
+- mlocate.db: a header, then for each directory a 16 byte timestamp, its NUL-terminated path,
+  and its entries, each a type byte (0 file, 1 directory) and a NUL-terminated name, closed by a byte 2;
+- LOCATE02 (findutils' locatedb): front-coded paths, each a signed byte (or 0x80 and a big-endian short)
+  giving the change in the length of the prefix shared with the previous path, followed by the NUL-terminated rest.
+
+plocate.db stores zstd-compressed posting lists and is not supported.
+System databases are usually only readable by the locate group, so this is mostly useful with a database
+built for the user, e.g. `updatedb -l 0 -o ~/.cache/vsl/mlocate.db -U ~`.
+"""
+
+
+import mmap
+import os
+import re
+
+
+MLOCATE_MAGIC = b'\0mlocate'
+LOCATE02_MAGIC = b'\0LOCATE02\0'
+
+_MLOCATE_ENTRIES = re.compile(rb'(?:[\x00\x01][^\x00]*\x00)*\x02')
+_MLOCATE_ENTRY = re.compile(rb'[\x00\x01]([^\x00]*)\x00')
+
+
+def lower(path):
+    return os.fsencode(os.fsdecode(path).lower())
+
+
+def _identity(st):
+    return st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class LocateDatabase:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.identity = _identity(os.fstat(f.fileno()))
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MLOCATE_MAGIC)] == MLOCATE_MAGIC:
+            self.format = 'mlocate'
+            conf_size = int.from_bytes(self.mm[8:12], 'big')
+            self.check_visibility = bool(self.mm[13])
+            root_end = self.mm.find(b'\0', 16)
+            self.start = root_end + 1 + conf_size
+        elif self.mm[:len(LOCATE02_MAGIC)] == LOCATE02_MAGIC:
+            self.format = 'locate02'
+            self.check_visibility = False
+            self.start = len(LOCATE02_MAGIC)
+        else:
+            self.mm.close()
+            raise ValueError(f"{path}: not an mlocate or LOCATE02 database")
+
+    def close(self):
+        self.mm.close()
+
+    def is_stale(self):
+        "Whether the file was changed or replaced since it was mapped, as updatedb does by renaming a new one over it."
+        try:
+            return _identity(os.stat(self.path)) != self.identity
+        except OSError:
+            return True
+
+    def directories(self):
+        "For mlocate, yield (path prefix, entries) for each directory, `entries` being the raw bytes of its entry list."
+        mm = self.mm
+        position = self.start
+        while position < len(mm):
+            path_end = mm.find(b'\0', position + 16)
+            if path_end == -1:
+                raise ValueError("Truncated mlocate database")
+            directory = mm[position + 16:path_end]
+            match = _MLOCATE_ENTRIES.match(mm, path_end + 1)
+            if match is None:
+                raise ValueError("Corrupt mlocate database")
+            position = match.end()
+            if self.check_visibility and not os.access(directory, os.R_OK | os.X_OK):
+                continue
+            yield directory if directory.endswith(b'/') else directory + b'/', mm[path_end + 1:position - 1]
+
+    def locate02_paths(self):
+        mm = self.mm
+        position = self.start
+        path = b''
+        prefix_length = 0
+        while position < len(mm):
+            count = mm[position]
+            position += 1
+            if count == 0x80:
+                count = int.from_bytes(mm[position:position + 2], 'big', signed=True)
+                position += 2
+            elif count > 0x7f:
+                count -= 0x100
+            prefix_length += count
+            end = mm.find(b'\0', position)
+            if end == -1:
+                raise ValueError("Truncated LOCATE02 database")
+            path = path[:prefix_length] + mm[position:end]
+            position = end + 1
+            yield path
+
+    def __iter__(self):
+        "All paths, in database order."
+        if self.format == 'mlocate':
+            for prefix, entries in self.directories():
+                for name in _MLOCATE_ENTRY.findall(entries):
+                    yield os.fsdecode(prefix + name)
+        else:
+            yield from map(os.fsdecode, self.locate02_paths())
+
+    def search(self, request, limit=None):
+        "Paths containing `request`, ignoring case, in database order, stopping after `limit` of them."
+        needle = lower(os.fsencode(request))
+        if not needle or limit == 0:
+            return
+        count = 0
+        for path in self._search(needle):
+            yield os.fsdecode(path)
+            count += 1
+            if count == limit:
+                return
+
+    def _search(self, needle):
+        if self.format == 'locate02':
+            for path in self.locate02_paths():
+                if needle in lower(path):
+                    yield path
+            return
+        # The match is done on whole directories first: if the prefix contains the needle all entries match,
+        # and otherwise entries only need to be looked at if the needle is in one of the names,
+        # or could straddle the prefix and a name.
+        for prefix, entries in self.directories():
+            lower_prefix = lower(prefix)
+            if needle in lower_prefix:
+                for name in _MLOCATE_ENTRY.findall(entries):
+                    yield prefix + name
+            elif needle in lower(entries) or any(lower_prefix.endswith(needle[:i]) for i in range(1, len(needle))):
+                for name in _MLOCATE_ENTRY.findall(entries):
+                    if needle in lower_prefix + lower(name):
+                        yield prefix + name
+
+
+def write_mlocate(path, directories, root='/'):
+    "Write an mlocate database of `directories`, (directory, [(name, is directory)...]) pairs, for tests and benchmarks."
+    with open(path, 'wb') as f:
+        f.write(MLOCATE_MAGIC + (0).to_bytes(4, 'big') + bytes([0, 0, 0, 0]) + os.fsencode(root) + b'\0')
+        for directory, entries in directories:
+            f.write(bytes(16) + os.fsencode(directory) + b'\0')
+            for name, is_directory in entries:
+                f.write(bytes([1 if is_directory else 0]) + os.fsencode(name) + b'\0')
+            f.write(b'\2')
+
+
+def write_locate02(path, paths):
+    "Write a LOCATE02 database of `paths`, for tests and benchmarks."
+    with open(path, 'wb') as f:
+        f.write(LOCATE02_MAGIC)
+        previous = b''
+        previous_length = 0
+        for path in map(os.fsencode, paths):
+            length = len(os.path.commonprefix([previous, path]))
+            count = length - previous_length
+            f.write(bytes([count & 0xff]) if -0x80 < count < 0x80 else b'\x80' + count.to_bytes(2, 'big', signed=True))
+            f.write(path[length:] + b'\0')
+            previous = path
+            previous_length = length
@@ -0,0 +1,182 @@
+# coding: utf-8
+#
+# Very Simple Launcher
+#
+# Copyright (C) Itaï BEN YAACOV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Resident index of the paths known to locate, answering case-insensitive substring queries in-process.
+
+The index lives in a directory holding:
+- `paths.VERSION`: the paths, NUL-terminated, as given by locate;
+- `lower.VERSION`: the same paths lowercased, NUL-terminated;
+- `blocks`: a pickle of (VERSION, source mtime, path offsets, lowercased path offsets, trigrams).
+
+A build writes the path files of a new version, then replaces `blocks`, so that the files always go together
+even if it is interrupted, and finally removes the path files of other versions.
+
+Both path files are memory-mapped.  Paths are grouped in blocks of BLOCK_SIZE,
+and `trigrams` maps each byte trigram of the lowercased paths to a bitmask of the blocks containing it,
+so that a query only scans the blocks that contain all its trigrams.
+
+Building takes a while, so it is done by running this module as a script:
+    python3 -m vsl.fetchers.locateindex DIRECTORY
+"""
+
+
+import array
+import bisect
+import mmap
+import os
+import pickle
+import subprocess
+import sys
+import time
+
+
+BLOCK_SIZE = 4096
+
+# Databases of plocate, mlocate and findutils, first one found wins.
+SOURCE_DATABASES = ('/var/lib/plocate/plocate.db', '/var/lib/mlocate/mlocate.db', '/var/cache/locate/locatedb')
+
+
+def source_mtime():
+    for path in SOURCE_DATABASES:
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            pass
+    return None
+
+
+def lower(path):
+    return os.fsencode(os.fsdecode(path).lower())
+
+
+def build(directory, paths):
+    "Write the index of `paths` (bytes, without NUL) into `directory`."
+    os.makedirs(directory, exist_ok=True)
+    mtime = source_mtime()
+    version = f'{time.time_ns()}-{os.getpid()}'
+    offsets = array.array('Q')
+    lower_offsets = array.array('Q')
+    trigrams = {}
+    with open(os.path.join(directory, f'paths.{version}'), 'wb') as paths_file, open(os.path.join(directory, f'lower.{version}'), 'wb') as lower_file:
+        offset = lower_offset = 0
+        block = []
+        for index, path in enumerate(paths):
+            lower_path = lower(path)
+            offsets.append(offset)
+            lower_offsets.append(lower_offset)
+            paths_file.write(path + b'\0')
+            lower_file.write(lower_path + b'\0')
+            offset += len(path) + 1
+            lower_offset += len(lower_path) + 1
+            block.append(lower_path)
+            if len(block) == BLOCK_SIZE:
+                _add_block(trigrams, index // BLOCK_SIZE, block)
+                block = []
+        if block:
+            _add_block(trigrams, len(offsets) // BLOCK_SIZE, block)
+        offsets.append(offset)
+        lower_offsets.append(lower_offset)
+    with open(os.path.join(directory, 'blocks.tmp'), 'wb') as f:
+        pickle.dump((version, mtime, offsets, lower_offsets, trigrams), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(os.path.join(directory, 'blocks.tmp'), os.path.join(directory, 'blocks'))
+    # Indexes already loaded keep their mappings of the files removed.
+    for name in os.listdir(directory):
+        if name.split('.')[0] in ('paths', 'lower') and name.split('.', 1)[-1] != version:
+            os.unlink(os.path.join(directory, name))
+
+
+def _add_block(trigrams, number, block):
+    text = b'\0'.join(block)
+    bit = 1 << number
+    for trigram in {text[i:i + 3] for i in range(len(text) - 2)}:
+        trigrams[trigram] = trigrams.get(trigram, 0) | bit
+
+
+def locate_paths():
+    with subprocess.Popen(['locate', '-0', '/'], stdout=subprocess.PIPE) as process:
+        rest = b''
+        while data := process.stdout.read(1 << 16):
+            *paths, rest = (rest + data).split(b'\0')
+            yield from paths
+        if rest:
+            yield rest
+
+
+class LocateIndex:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'blocks'), 'rb') as f:
+            version, self.mtime, self.offsets, self.lower_offsets, self.trigrams = pickle.load(f)
+        self.count = len(self.offsets) - 1
+        self.blocks = (self.count + BLOCK_SIZE - 1) // BLOCK_SIZE
+        self.paths = self._map(f'paths.{version}')
+        self.lower = self._map(f'lower.{version}')
+
+    def _map(self, name):
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        for m in (self.paths, self.lower):
+            if isinstance(m, mmap.mmap):
+                m.close()
+
+    def is_stale(self):
+        return source_mtime() != self.mtime
+
+    def candidate_blocks(self, needle):
+        mask = (1 << self.blocks) - 1
+        for i in range(len(needle) - 2):
+            mask &= self.trigrams.get(needle[i:i + 3], 0)
+            if not mask:
+                break
+        block = 0
+        while mask:
+            if mask & 1:
+                yield block
+            mask >>= 1
+            block += 1
+
+    def path(self, index):
+        return os.fsdecode(self.paths[self.offsets[index]:self.offsets[index + 1] - 1])
+
+    def search(self, request, limit=None):
+        "Paths containing `request`, ignoring case, in locate order."
+        needle = lower(os.fsencode(request))
+        if not needle or b'\0' in needle:
+            return []
+        results = []
+        for block in self.candidate_blocks(needle):
+            end = self.lower_offsets[min((block + 1) * BLOCK_SIZE, self.count)]
+            position = self.lower.find(needle, self.lower_offsets[block * BLOCK_SIZE], end)
+            while position != -1:
+                index = bisect.bisect_right(self.lower_offsets, position) - 1
+                results.append(self.path(index))
+                if len(results) == limit:
+                    return results
+                position = self.lower.find(needle, self.lower_offsets[index + 1], end)
+        return results
+
+
+if __name__ == '__main__':
+    build(sys.argv[1], locate_paths())
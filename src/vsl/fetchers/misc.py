@@ -21,19 +21,28 @@
 import asyncio
 import os
 import re
+import sys
 
+from gi.repository import GLib
 from gi.repository import Gio
 
 from . import base
+from . import locatedb
+from . import locateindex
+from .. import __application__
 from .. import items
+from .. import logger
 
 
 @base.score
 class FetcherActions(base.FetcherLeaf):
     def __init__(self):
         super().__init__(_("VSL actions"), icon='face-devilish')
-        self.append_item(items.ItemAction(name=_("Quit"), detail='quit', icon='application-exit'))
-        self.append_item(items.ItemAction(name=_("Close window"), detail='close', icon='window-close'))
+        self.append_items([
+            (items.ItemAction(name=_("Quit"), detail='quit', icon='application-exit'), 0.0),
+            (items.ItemAction(name=_("Close window"), detail='close', icon='window-close'), 0.0),
+            (items.ItemAction(name=_("Log statistics"), detail='stats', icon='utilities-system-monitor'), 0.0),
+        ])
         self.first = True
 
     def do_request(self, request):
@@ -42,46 +51,176 @@ class FetcherActions(base.FetcherLeaf):
             self.first = False
 
 
+class _LocateRules:
+    """
+    Exclusions and score adjustments of located paths, applied in one pass each.
+
+    The exclude patterns are merged into a single alternative.  The score rules, (pattern, bonus) pairs,
+    are compiled into a single pattern made of an optional lookahead for each of them,
+    and the groups matched tell which bonuses to add up.
+    """
+
+    def __init__(self, exclude, bonus):
+        self.exclude = re.compile('|'.join(f'(?:{pattern})' for pattern in exclude)) if exclude else None
+        rules = [
+            (f'^(?!{re.escape(os.path.expanduser("~/"))})', -0.1),
+            (r'/\.(?:git|cache)/', -0.3),
+        ]
+        rules.extend((pattern, float(value)) for pattern, value in bonus.items())
+        self.bonuses = {f'_rule{i}': value for i, (pattern, value) in enumerate(rules)}
+        self.pattern = re.compile(''.join(f'(?:(?=.*?(?P<_rule{i}>{pattern})))?' for i, (pattern, value) in enumerate(rules)), re.DOTALL)
+
+    def score(self, path):
+        "Summed bonus of the rules matching `path`, or None if it is excluded."
+        if self.exclude is not None and self.exclude.search(path):
+            return None
+        match = self.pattern.match(path)
+        return sum(value for group, value in self.bonuses.items() if match.group(group) is not None)
+
+
 @base.score
-class FetcherLocate(base.FetcherLeaf):
-    def __init__(self, *, min_length='4', exclude='', max_paths=10000, bonus={}):
+class FetcherLocate(base.FetcherColumnLeaf):
+    coalesce = True
+
+    # Paths are classified by batches of STAT_BATCH, at most STAT_JOBS of them being in worker threads at a time.
+    STAT_BATCH = 256
+    STAT_JOBS = 4
+    READ_SIZE = 1 << 16
+    # Added by classify() to executables.
+    EXECUTABLE_BONUS = 0.1
+
+    def __init__(self, *, min_length='4', exclude='', max_paths=10000, bonus={}, index='no', index_refresh='3600', database='', score_processes='0'):
         super().__init__(_("Locate files"), 'system-search')
+        self.score_processes = int(score_processes)
         self.min_length = int(min_length)
-        self.exclude = [pattern for pattern in exclude.split() if pattern]
-        self.max_paths = max_paths
-        if bonus:
-            print("Bonus not implemented yet")
+        self.rules = _LocateRules(exclude.split(), bonus)
+        self.max_paths = int(max_paths)
 
+        self.notice = None
         self.task = None
         self.last_async_request = None
+        self.classify_tasks = set()
+        self.stat_semaphore = asyncio.Semaphore(self.STAT_JOBS)
+
+        self.database_path = os.path.expanduser(database) if database else None
+        self.database = None
+
+        self.index = None
+        self.index_task = None
+        self.index_source = None
+        if base.boolean(index):
+            self.index_directory = os.path.join(GLib.get_user_cache_dir(), __application__, 'locate')
+            self.index_task = asyncio.create_task(self.refresh_index())
+            self.index_source = GLib.timeout_add_seconds(int(index_refresh), self.refresh_index_cb, priority=GLib.PRIORITY_LOW)
+
+    def cleanup(self):
+        self.cancel()
+        for task in self.classify_tasks:
+            task.cancel()
+        if self.index_source is not None:
+            GLib.source_remove(self.index_source)
+            self.index_source = None
+        if self.index_task is not None:
+            self.index_task.cancel()
+            self.index_task = None
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+        super().cleanup()
+
+    def refresh_index_cb(self):
+        if self.index_task is None:
+            self.index_task = asyncio.create_task(self.refresh_index())
+        return GLib.SOURCE_CONTINUE
+
+    async def refresh_index(self):
+        "Load the index, rebuilding it first in a separate process if it is missing, unreadable or older than the locate database."
+        try:
+            if self.index is None:
+                await self.load_index(logger.debug)
+            if self.index is None or self.index.is_stale():
+                logger.debug('Building locate index')
+                process = await asyncio.create_subprocess_exec(sys.executable, locateindex.__file__, self.index_directory)
+                if await process.wait() == 0:
+                    await self.load_index(logger.warning)
+                else:
+                    logger.warning(f'Building locate index failed with status {process.returncode}')
+        finally:
+            self.index_task = None
+
+    async def load_index(self, log):
+        try:
+            self.set_index(await base.run_in_thread(locateindex.LocateIndex, self.index_directory))
+        except Exception as error:
+            # Missing, truncated or written by another version: whatever the error, it calls for a rebuild.
+            log(f'No usable locate index: {error!r}')
+
+    def set_index(self, index):
+        # The previous index may still be searched by a worker thread, let it be closed when collected.
+        self.index = index
+        self.last_async_request = None
 
     def do_request(self, request):
         if self.last_async_request is not None and request.startswith(self.last_async_request):
             return
-        self.data.clear()
+        self.cancel()
+        self.clear()
+        self.notice = None
         self.last_async_request = None
         if len(request) < self.min_length:
-            self.append_item(items.ItemNoop(name=_("Type at least {min_length} characters to locate files").format(min_length=self.min_length), detail='', icon=self.icon), 0.2)
-            self.task = None
+            self.notice = items.ItemNoop(name=_("Type at least {min_length} characters to locate files").format(min_length=self.min_length), detail='', icon=self.icon)
+            self.changed()
         else:
             self.task = asyncio.create_task(self.async_do_request(request))
 
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def make_item(self, name, path, item_class):
+        return (item_class or items.ItemFile)(path)
+
+    def __iter__(self):
+        if self.notice is not None:
+            yield self.notice, 0.2
+        yield from super().__iter__()
+
     async def async_do_request(self, request):
         task = asyncio.current_task()
         if task != self.task:
             return
 
+        if self.index is not None:
+            paths = await base.run_in_thread(self.index.search, request, self.max_paths)
+            if task != self.task:
+                return
+            self.append_paths(paths)
+            self.task = None
+            if len(paths) < self.max_paths:
+                self.last_async_request = request
+            return
+
+        if self.database_path is not None:
+            paths = await base.run_in_thread(self.search_database, request)
+            if task != self.task:
+                return
+            if paths is not None:
+                self.append_paths(paths)
+                self.task = None
+                if len(paths) < self.max_paths:
+                    self.last_async_request = request
+                return
+
         process = None
         try:
-            self.freeze()
             process = await asyncio.create_subprocess_exec('locate', '-iN', '--', request, stdout=asyncio.subprocess.PIPE)
             if task != self.task:
                 return
-
             data = b''
             counter = 0
             while True:
-                new_data = await process.stdout.read(1024)
+                new_data = await process.stdout.read(self.READ_SIZE)
                 if task != self.task:
                     return
                 elif not new_data:
@@ -89,44 +228,135 @@ class FetcherLocate(base.FetcherLeaf):
                     self.last_async_request = request
                     return
                 *paths, data = (data + new_data).split(b'\n')
-                for path in paths:
-                    self.add_path(path.decode())
-                    counter += 1
-                    if counter == self.max_paths:
-                        self.task = None
-                        return
+                paths = paths[:self.max_paths - counter]
+                counter += len(paths)
+                self.append_paths(map(bytes.decode, paths))
+                if counter == self.max_paths:
+                    self.task = None
+                    return
         finally:
-            self.thaw()
             if process is not None and process.returncode is None:
                 process.kill()
                 await process.communicate()
 
-    def add_path(self, path):
-        for pattern in self.exclude:
-            if re.search(pattern, path):
+    def search_database(self, request):
+        "Search the locate database directly, or return None if it cannot be read, falling back to running locate from then on."
+        try:
+            # The previous mapping may still be searched by a worker thread, let it be closed when collected.
+            if self.database is None or self.database.is_stale():
+                self.database = locatedb.LocateDatabase(self.database_path)
+            return list(self.database.search(request, self.max_paths))
+        except (OSError, ValueError) as error:
+            logger.warning(f'Cannot read locate database {self.database_path}, running locate instead: {error}')
+            self.database_path = None
+            return None
+
+    def path_row(self, path):
+        "Row for `path` or None if it is excluded, as an unclassified placeholder: the file system is looked at later by classify()."
+        score = self.rules.score(path)
+        if score is None:
+            return None
+        return os.path.basename(path), path, score, None
+
+    def append_paths(self, paths):
+        first = len(self.rows)
+        self.append_rows(filter(None, map(self.path_row, paths)))
+        rows = self.rows
+        for start in range(first, len(rows), self.STAT_BATCH):
+            task = asyncio.create_task(self.classify(rows, start, rows.details[start:start + self.STAT_BATCH]))
+            self.classify_tasks.add(task)
+            task.add_done_callback(self.classify_tasks.discard)
+
+    async def classify(self, rows, start, paths):
+        "Upgrade the placeholder rows from `start` on once the stat calls for their paths are done in a worker thread."
+        async with self.stat_semaphore:
+            if rows is not self.rows:
                 return
-        score = 0.0
-        if not path.startswith(os.path.expanduser('~/')):
-            score -= 0.1
-        if '/.git/' in path or '/.cache/' in path:
-            score -= 0.3
-        if os.path.isfile(path) and os.access(path, os.X_OK):
-            item = items.ItemExecutable(path)
-            score += 0.1
-        elif os.path.isdir(path):
-            item = items.ItemFolder(path)
-        else:
-            item = items.ItemFile(path)
-        self.append_item(item, score)
+            classes = await base.run_in_thread(self.classify_paths, paths)
+        if rows is not self.rows:
+            return
+        for index, (name, item_class, bonus) in enumerate(classes, start):
+            rows.update(index, name, rows.scores[index] + bonus, item_class)
+        self.changed()
+
+    @classmethod
+    def classify_paths(cls, paths):
+        "(name, item class, score bonus) for each path."
+        classes = []
+        for path in paths:
+            name = os.path.basename(path)
+            if os.path.isfile(path) and os.access(path, os.X_OK):
+                classes.append((name, items.ItemExecutable, cls.EXECUTABLE_BONUS))
+            elif os.path.isdir(path):
+                classes.append((name + '/', items.ItemFolder, 0.0))
+            else:
+                classes.append((name, items.ItemFile, 0.0))
+        return classes
 
 
 @base.score
 class FetcherLaunchApp(base.FetcherLeaf):
-    def __init__(self):
-        super().__init__(_("Applications"), 'applications-utilities')
-        for appinfo in Gio.app_info_get_all():
-            name = appinfo.get_name()
-            filename = Gio.DesktopAppInfo.get_filename(appinfo)  # GI bug
-            icon = appinfo.get_icon()
-            item = items.ItemDesktop(name=name, detail=filename, title=_("{name} [application]"), icon=icon)
-            self.append_item(item)
+    """
+    Installed applications, kept up to date by following Gio.AppInfoMonitor.
+
+    On a change, the applications are listed again in a worker thread and compared by desktop file id:
+    new ones are appended, and removed ones dropped.
+    """
+
+    def __init__(self, threaded='yes'):
+        super().__init__(_("Applications"), 'applications-utilities', threaded=base.boolean(threaded))
+        self.update_task = None
+        self.update_again = False
+        self.monitor = Gio.AppInfoMonitor.get()
+        self.monitor.connect('changed', self.monitor_changed_cb)
+        self.start_load()
+
+    def cleanup(self):
+        self.monitor.disconnect_by_func(self.monitor_changed_cb)
+        if self.update_task is not None:
+            self.update_task.cancel()
+            self.update_task = None
+        super().cleanup()
+
+    def load(self):
+        return ((self.appinfo_item(appinfo), 0.0) for appinfo in Gio.app_info_get_all())
+
+    @staticmethod
+    def appinfo_item(appinfo):
+        name = appinfo.get_name()
+        filename = Gio.DesktopAppInfo.get_filename(appinfo)  # GI bug
+        icon = appinfo.get_icon()
+        return items.ItemDesktop(name=name, detail=filename, title=_("{name} [application]"), icon=icon, appinfo=appinfo)
+
+    def monitor_changed_cb(self, monitor):
+        if self.load_task is not None:
+            # Still loading: start over, rather than compare with a partial list.
+            self.load_task.cancel()
+            self.clear()
+            self.start_load()
+        elif self.update_task is not None:
+            self.update_again = True
+        else:
+            self.update_task = asyncio.create_task(self.update())
+
+    async def update(self):
+        try:
+            self.update_again = True
+            while self.update_again:
+                self.update_again = False
+                appinfos = {appinfo.get_id(): appinfo for appinfo in await base.run_in_thread(Gio.app_info_get_all)}
+                self.apply_update(appinfos)
+        finally:
+            self.update_task = None
+
+    def apply_update(self, appinfos):
+        "Make the items match `appinfos`, a dictionary by desktop file id."
+        known = {item.appinfo.get_id() for item, score in self.data}
+        added = [(self.appinfo_item(appinfo), 0.0) for app_id, appinfo in appinfos.items() if app_id not in known]
+        kept = [(item, score) for item, score in self.data if item.appinfo.get_id() in appinfos]
+        logger.debug(f'Applications changed: {len(added)} added, {len(self.data) - len(kept)} removed')
+        if len(kept) < len(self.data):
+            self.data[:] = kept + added
+            self.changed()
+        else:
+            self.append_items(added)
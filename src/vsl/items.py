@@ -23,13 +23,24 @@ from gi.repository import Gio
 from gi.repository import Gtk
 
 import os
-import difflib
+import array
 import subprocess
 
 from . import logger
+from . import scoring
+
+
+class IconData:
+    "Encoded image used as an item icon, only decoded when displayed."
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
 
 
 class ItemBase:
+    score_bonus = 0.0
+
     def __init__(self, *, name, detail, title=None, icon=None):
         self.name = name
         self.detail = detail
@@ -42,25 +53,112 @@ class ItemBase:
     def format_title(self):
         return self.title.format_map(vars(self))
 
-    @staticmethod
-    def _score(request, something):
-        if not request or not something:
-            return 0.0
-        opcodes = difflib.SequenceMatcher(None, request, something).get_opcodes()
-        n1 = [i2 - i1 for opcode, i1, i2, j1, j2 in opcodes if opcode in ('replace', 'delete')]
-        n2 = [j2 - j1 for opcode, i1, i2, j1, j2 in opcodes if opcode in ('replace', 'insert')]
-        score = 1.2
-        score -= 2 * sum(n1) / len(request) + len(n1) / 10
-        score -= sum(n2) / len(something) / len(request) + len(n2) / 20
-        return score
+    def score_keys(self):
+        "Lowercased strings to match requests against, or None to score by score_bonus alone."
+        return self.name.lower(), self.detail.lower()
 
     def score(self, request):
-        return max(self._score(request.lower(), self.name.lower()), self._score(request.lower(), self.detail.lower()) - 0.05)
+        return scoring.Scorer(request).score_item(self)
 
     def __repr__(self):
         return f'Item({self.format_title()})'
 
 
+class ItemRow:
+    "Stand-in for a row of an ItemColumns, building the actual item only when something beyond scoring needs it."
+    __slots__ = ('columns', 'index', 'version')
+
+    def __init__(self, columns, index, version=0):
+        self.columns = columns
+        self.index = index
+        self.version = version
+
+    def __eq__(self, other):
+        return isinstance(other, ItemRow) and self.columns is other.columns and self.index == other.index and self.version == other.version
+
+    def __hash__(self):
+        return hash((id(self.columns), self.index, self.version))
+
+    def __getattr__(self, name):
+        return getattr(self.columns.item(self.index), name)
+
+    @property
+    def score_bonus(self):
+        return self.columns.score_bonus
+
+    def score_keys(self):
+        return self.columns.name_keys[self.index], self.columns.detail_keys[self.index]
+
+    def __repr__(self):
+        return f'ItemRow({self.columns.names[self.index]})'
+
+
+class ItemColumns:
+    """
+    Column-wise storage of (item, score) pairs.
+
+    Names, details, scores and lowercased search keys are kept in flat columns,
+    and `extra` holds whatever else make_item(name, detail, extra) needs to build the item.
+    Iterating yields ItemRow stand-ins, so items are only built for the rows actually displayed.
+    A row changed by update() gets a new version, and its ItemRows from before no longer compare equal to the new ones.
+    The indices of updated rows are logged in `updated`, in order.
+    """
+
+    def __init__(self, make_item, score_bonus=0.0):
+        self.make_item = make_item
+        self.score_bonus = score_bonus
+        self.names = []
+        self.details = []
+        self.extras = []
+        self.scores = array.array('d')
+        self.name_keys = []
+        self.detail_keys = []
+        self.built = {}
+        self.versions = {}
+        self.updated = []
+
+    def __len__(self):
+        return len(self.scores)
+
+    @staticmethod
+    def _key(s):
+        key = s.lower()
+        return s if key == s else key
+
+    def append(self, name, detail, score=0.0, extra=None):
+        self.names.append(name)
+        self.details.append(detail)
+        self.extras.append(extra)
+        self.scores.append(score)
+        self.name_keys.append(self._key(name))
+        self.detail_keys.append(self._key(detail))
+        return ItemRow(self, len(self.scores) - 1)
+
+    def update(self, index, name, score, extra):
+        self.names[index] = name
+        self.name_keys[index] = self._key(name)
+        self.scores[index] = score
+        self.extras[index] = extra
+        self.built.pop(index, None)
+        self.versions[index] = self.versions.get(index, 0) + 1
+        self.updated.append(index)
+
+    def pair(self, index):
+        "The current (ItemRow, score) pair of row `index`."
+        return ItemRow(self, index, self.versions.get(index, 0)), self.scores[index]
+
+    def item(self, index):
+        item = self.built.get(index)
+        if item is None:
+            item = self.built[index] = self.make_item(self.names[index], self.details[index], self.extras[index])
+        return item
+
+    def __iter__(self):
+        versions = self.versions
+        for index, score in enumerate(self.scores):
+            yield ItemRow(self, index, versions.get(index, 0)), score
+
+
 class ItemChangeRequest(ItemBase):
     "Special item type, will not need to activate."
     def __init__(self, *, pattern, repl, **kwargs):
@@ -70,19 +168,24 @@ class ItemChangeRequest(ItemBase):
 
 
 class ItemNoop(ItemBase):
+    score_bonus = 0.2
+
     def activate(self):
         pass
 
-    def score(self, request):
-        return 0.2
+    def score_keys(self):
+        return None
 
 
 class ItemDesktop(ItemBase):
-    def activate(self):
-        Gio.DesktopAppInfo.new_from_filename(self.detail).launch()
+    score_bonus = 0.1
 
-    def score(self, request):
-        return super().score(request) + 0.1
+    def __init__(self, *, appinfo=None, **kwargs):
+        super().__init__(**kwargs)
+        self.appinfo = appinfo
+
+    def activate(self):
+        (self.appinfo or Gio.DesktopAppInfo.new_from_filename(self.detail)).launch()
 
 
 class ItemLauncher(ItemBase):
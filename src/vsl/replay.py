@@ -0,0 +1,230 @@
+# coding: utf-8
+#
+# Very Simple Launcher
+#
+# Copyright (C) Itaï BEN YAACOV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Record typing sessions and replay them against a fetcher tree:
+    vsl --record FILE
+    python3 -m vsl.replay FILE [--config FILE] [--stand-in] [--speed FACTOR]
+
+A recording has one JSON object per line: {"time": ..., "request": ...} when the request changes,
+and {"time": ..., "results": [[title, detail, score, name, base score, source], ...]} when the results shown change, times being in seconds.
+The source of a result is the configuration section of the imported fetcher it comes from, and its base score the one that fetcher gave it
+before scoring, with the item score bonus added; both are null for results coming from no imported fetcher, such as prefix hints,
+and the name is null for items scored by their bonus alone.
+
+Replaying sends the recorded requests to the configured tree at the recorded pace divided by FACTOR (0 meaning as fast as possible).
+With --stand-in, the imported fetchers of that tree are replaced by leaves holding the items the recording saw coming from them.
+The latency of a request is the time until the last change of the results before the next request.
+Requests whose final results come out in a different order than recorded are reported.
+"""
+
+
+import argparse
+import asyncio
+import functools
+import json
+import sys
+import time
+
+from gi.repository import GLib
+
+from . import fetchers
+from . import items
+from .fetchers import base
+
+
+def base_fetcher(fetcher):
+    "The fetcher at the bottom of the pipes and deferred fetcher making up `fetcher`, whose scores are the base ones."
+    while getattr(fetcher, 'fetcher', None) is not None:
+        fetcher = fetcher.fetcher
+    return fetcher
+
+
+class Recorder:
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.start = time.monotonic()
+        # The fetchers of the imported sections by name, as gathered by fetchers.fetcher_from_config(),
+        # and for the base fetcher of each, a dictionary of its (item, score) pairs, or None once it changed.
+        self.sources = {}
+        self.indexes = {}
+
+    def close(self):
+        self.file.close()
+
+    def write(self, **record):
+        self.file.write(json.dumps({'time': round(time.monotonic() - self.start, 6), **record}) + '\n')
+        self.file.flush()
+
+    def request(self, request):
+        self.write(request=request)
+
+    def results(self, pairs):
+        self.write(results=[[item.format_title(), item.detail, score, *self.origin(item)] for item, score in pairs])
+
+    def origin(self, item):
+        "(name, base score, source) of `item`, the last two being None if it comes from no imported fetcher."
+        for source, fetcher in self.sources.items():
+            fetcher = base_fetcher(fetcher)
+            if fetcher not in self.indexes:
+                fetcher.hooks.append(functools.partial(self.forget, fetcher))
+            index = self.indexes.get(fetcher)
+            if index is None:
+                index = self.indexes[fetcher] = dict(fetcher)
+            score = index.get(item)
+            if score is not None:
+                return (None if item.score_keys() is None else item.name), score + item.score_bonus, source
+        return item.name, None, None
+
+    def forget(self, fetcher, appended=None):
+        self.indexes[fetcher] = None
+
+
+def read_recording(path):
+    """
+    List of (time, request, final recorded results or None if there were no results for it) for the requests,
+    and for each source, a dictionary of the (name, base score) of the items seen coming from it by (title, detail).
+    """
+    requests = []
+    sources = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if 'request' in record:
+                requests.append([record['time'], record['request'], None])
+            elif 'results' in record:
+                for title, detail, score, name, base_score, source in record['results']:
+                    if source is not None:
+                        sources.setdefault(source, {})[title, detail] = name, base_score
+                if requests:
+                    requests[-1][2] = [(title, detail) for title, detail, *origin in record['results']]
+    return requests, sources
+
+
+class StandInItem(items.ItemBase):
+    "Item as recorded, scored by its base score alone if it has no name."
+
+    def __init__(self, *, name, detail, title):
+        super().__init__(name=name or '', detail=detail, title=title.replace('{', '{{').replace('}', '}}'))
+        self.keyed = name is not None
+
+    def activate(self):
+        pass
+
+    def score_keys(self):
+        return super().score_keys() if self.keyed else None
+
+
+@base.score
+class StandInLeaf(base.FetcherLeaf):
+    "The items seen coming from a source in the recording, with their base scores."
+
+    def __init__(self, source, seen):
+        super().__init__(source, 'edit-find')
+        self.append_items((StandInItem(name=name, detail=detail, title=title), base_score) for (title, detail), (name, base_score) in seen.items())
+
+
+def pump():
+    context = GLib.MainContext.default()
+    while context.pending():
+        context.iteration(False)
+
+
+async def run(root, recording, speed, settle):
+    "Replay `recording`, returning for each request its latency in seconds (None if nothing changed) and final results."
+    loop = asyncio.get_running_loop()
+    changes = []
+    root.hooks.append(lambda appended: changes.append(loop.time()))
+
+    async def wait(deadline):
+        while True:
+            pump()
+            now = loop.time()
+            if now >= deadline:
+                return
+            await asyncio.sleep(min(0.001, deadline - now))
+
+    async def wait_quiet():
+        while True:
+            last = changes[-1] if changes else 0.0
+            await wait(max(last, loop.time()) + settle)
+            if (changes[-1] if changes else 0.0) == last:
+                return
+
+    replayed = []
+    start = loop.time()
+    for i, (time_, request, recorded) in enumerate(recording):
+        if speed:
+            await wait(start + time_ / speed)
+        changes.clear()
+        sent = loop.time()
+        root.do_request(request)
+        if speed and i + 1 < len(recording):
+            await wait(start + recording[i + 1][0] / speed)
+        else:
+            await wait_quiet()
+        results = [(item.format_title(), item.detail) for item, score in root]
+        replayed.append((changes[-1] - sent if changes else None, results))
+    return replayed
+
+
+def percentile(samples, p):
+    return samples[max(0, -(-len(samples) * p // 100) - 1)]
+
+
+async def replay(args):
+    recording, sources = read_recording(args.recording)
+    stand_in = (lambda source: StandInLeaf(source, sources.get(source, {}))) if args.stand_in else None
+    root = fetchers.fetcher_from_config(fetchers.read_config(args.config), stand_in=stand_in)
+    try:
+        replayed = await run(root, recording, args.speed, args.settle / 1000)
+    finally:
+        root.cleanup()
+
+    latencies = sorted(latency * 1000 for latency, results in replayed if latency is not None)
+    print(f'{len(recording)} requests, {len(latencies)} with results changes')
+    if latencies:
+        print('Latency (ms): ' + ' '.join(f'p{p}={percentile(latencies, p):.1f}' for p in (50, 95, 99)) + f' max={latencies[-1]:.1f}')
+    differences = 0
+    for (time_, request, recorded), (latency, results) in zip(recording, replayed):
+        if recorded is not None and recorded != results:
+            differences += 1
+            print(f'Results differ for {request!r}:')
+            for title, detail in recorded:
+                print(f'  - {title} {detail}')
+            for title, detail in results:
+                print(f'  + {title} {detail}')
+    print(f'{differences} requests with different results')
+    return 1 if differences else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python3 -m vsl.replay', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('recording', help="file written by vsl --record")
+    parser.add_argument('--config', help="configuration file, the user's one by default")
+    parser.add_argument('--stand-in', action='store_true', help="replace the imported fetchers by the items seen coming from them in the recording")
+    parser.add_argument('--speed', type=float, default=1.0, help="speed factor, 0 to send each request once the previous one settled")
+    parser.add_argument('--settle', type=float, default=200, help="milliseconds without changes after which a request is considered settled")
+    args = parser.parse_args(argv)
+    return asyncio.run(replay(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
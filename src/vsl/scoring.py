@@ -0,0 +1,184 @@
+# coding: utf-8
+#
+# Very Simple Launcher
+#
+# Copyright (C) Itaï BEN YAACOV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import array
+import asyncio
+import concurrent.futures
+import difflib
+import heapq
+import itertools
+import multiprocessing
+
+
+MAX_SCORE = 1.2
+
+# SequenceMatcher's autojunk heuristic kicks in for sequences this long.
+_AUTOJUNK_LENGTH = 200
+
+
+def _combine(la, lb, n1_sum, n1_len, n2_sum, n2_len):
+    # Keep the exact sequence of float operations of score_string(), so fast paths give identical scores.
+    score = MAX_SCORE
+    score -= 2 * n1_sum / la + n1_len / 10
+    score -= n2_sum / lb / la + n2_len / 20
+    return score
+
+
+def score_string(request, something):
+    if not request or not something:
+        return 0.0
+    opcodes = difflib.SequenceMatcher(None, request, something).get_opcodes()
+    n1 = [i2 - i1 for opcode, i1, i2, j1, j2 in opcodes if opcode in ('replace', 'delete')]
+    n2 = [j2 - j1 for opcode, i1, i2, j1, j2 in opcodes if opcode in ('replace', 'insert')]
+    return _combine(len(request), len(something), sum(n1), len(n1), sum(n2), len(n2))
+
+
+def score_bound(request_length, key, missing):
+    """
+    Upper bound of score_string() for a request of length `request_length` and `key`,
+    `missing` characters of the request not occurring in `key` at all: they can only be deleted or replaced.
+    """
+    if not key:
+        return 0.0
+    return _combine(request_length, len(key), missing, missing > 0, 0, 0)
+
+
+class Scorer:
+    """
+    Scores many strings against a single request.
+
+    Equivalent to score_string(request.lower(), ...), but the request is prepared once,
+    results are memoized (file names and titles repeat a lot), and the two common cases,
+    where the request is a substring of the key or shares no character with it,
+    are computed without running a SequenceMatcher.
+    """
+
+    def __init__(self, request):
+        self.request = request.lower()
+        self.chars = frozenset(self.request)
+        self.matcher = difflib.SequenceMatcher(None, self.request, '')
+        self.cache = {}
+
+    def __call__(self, something):
+        score = self.cache.get(something)
+        if score is None:
+            score = self.cache[something] = self._score(something)
+        return score
+
+    def _score(self, something):
+        request = self.request
+        if not request or not something:
+            return 0.0
+        la = len(request)
+        lb = len(something)
+        if lb < _AUTOJUNK_LENGTH:
+            j = something.find(request)
+            if j >= 0:
+                n2_len = (j > 0) + (j + la < lb)
+                return _combine(la, lb, 0, 0, lb - la, n2_len)
+        if self.chars.isdisjoint(something):
+            return _combine(la, lb, la, 1, lb, 1)
+        self.matcher.set_seq2(something)
+        n1_sum = n1_len = n2_sum = n2_len = 0
+        for opcode, i1, i2, j1, j2 in self.matcher.get_opcodes():
+            if opcode in ('replace', 'delete'):
+                n1_sum += i2 - i1
+                n1_len += 1
+            if opcode in ('replace', 'insert'):
+                n2_sum += j2 - j1
+                n2_len += 1
+        return _combine(la, lb, n1_sum, n1_len, n2_sum, n2_len)
+
+    def score_item(self, item):
+        keys = item.score_keys()
+        if keys is None:
+            return item.score_bonus
+        name, detail = keys
+        return max(self(name), self(detail) - 0.05) + item.score_bonus
+
+    def score_items(self, items):
+        return array.array('d', map(self.score_item, items))
+
+
+# The shard of the keys held by a ScoringPool worker process, as (index, name key, detail key, bonus, score) tuples.
+_shard = []
+
+
+def _shard_reset():
+    _shard.clear()
+
+
+def _shard_extend(rows):
+    _shard.extend(rows)
+
+
+def _shard_update(rows, stride):
+    for row in rows:
+        _shard[row[0] // stride] = row
+
+
+def _shard_top(request, k):
+    scorer = Scorer(request)
+    return heapq.nlargest(k, ((score + bonus if name is None else score + (max(scorer(name), scorer(detail) - 0.05) + bonus), -index) for index, name, detail, bonus, score in _shard))
+
+
+class ScoringPool:
+    """
+    Scores keys spread over worker processes, each keeping its shard between requests.
+
+    Each shard has its own single process executor, so that calls for a shard always reach the process holding it, in order.
+    Row `index` goes to shard index % processes.
+    Keys are shipped once through extend(), changed ones through update(), and a request only sends the request itself.
+    """
+
+    def __init__(self, processes):
+        context = multiprocessing.get_context('forkserver')
+        self.executors = [concurrent.futures.ProcessPoolExecutor(1, mp_context=context) for i in range(processes)]
+        self.count = 0
+
+    def shutdown(self):
+        for executor in self.executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def reset(self):
+        for executor in self.executors:
+            executor.submit(_shard_reset)
+        self.count = 0
+
+    def extend(self, rows):
+        "Add (name key, detail key, bonus, score) rows, as in score_item(), with None keys for items scored by their bonus alone."
+        rows = [(index, *row) for index, row in enumerate(rows, self.count)]
+        self.count += len(rows)
+        for shard, executor in enumerate(self.executors):
+            part = [row for row in rows if row[0] % len(self.executors) == shard]
+            if part:
+                executor.submit(_shard_extend, part)
+
+    def update(self, rows):
+        "Replace rows given as (index, name key, detail key, bonus, score)."
+        for shard, executor in enumerate(self.executors):
+            part = [row for row in rows if row[0] % len(self.executors) == shard]
+            if part:
+                executor.submit(_shard_update, part, len(self.executors))
+
+    async def top(self, request, k):
+        "The `k` best (score, -index) pairs for `request`, ties going to the lower index."
+        results = await asyncio.gather(*(asyncio.wrap_future(executor.submit(_shard_top, request, k)) for executor in self.executors))
+        return heapq.nlargest(k, itertools.chain.from_iterable(results))
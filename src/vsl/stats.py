@@ -0,0 +1,195 @@
+# coding: utf-8
+#
+# Very Simple Launcher
+#
+# Copyright (C) Itaï BEN YAACOV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Per-fetcher timing and counting, enabled by --stats.
+
+instrument() switches every fetcher of a tree to a subclass timing do_request() and iteration,
+and counting notifications.  Times include the time spent upstream.
+Figures are accumulated per request, and dump() logs percentiles over the requests.
+
+The results widget reports its changes, so that the latency from a keystroke to the frames showing its results is measured,
+as well as the frame time while the results keep changing: the interval between consecutive frames which both follow a change.
+"""
+
+
+import time
+
+from . import logger
+
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(samples, p):
+    "Nearest-rank percentile of sorted `samples`."
+    return samples[max(0, -(-len(samples) * p // 100) - 1)]
+
+
+class FetcherStats:
+    FIELDS = ('request_ms', 'iterate_ms', 'iterations', 'items', 'changes', 'appends', 'appended')
+
+    def __init__(self, label):
+        self.label = label
+        self.samples = {field: [] for field in self.FIELDS}
+        self.reset()
+
+    def reset(self):
+        self.current = dict.fromkeys(self.FIELDS, 0)
+
+    def close(self):
+        if any(self.current.values()):
+            for field, value in self.current.items():
+                self.samples[field].append(value)
+        self.reset()
+
+    def requested(self, elapsed):
+        self.current['request_ms'] += elapsed * 1000
+
+    def iterated(self, count, elapsed):
+        self.current['iterate_ms'] += elapsed * 1000
+        self.current['iterations'] += 1
+        self.current['items'] += count
+
+    def notified(self, appended):
+        if appended is None:
+            self.current['changes'] += 1
+        else:
+            self.current['appends'] += 1
+            self.current['appended'] += len(appended)
+
+
+def _timed(iterator, fetcher_stats):
+    clock = time.perf_counter
+    count = 0
+    elapsed = 0.0
+    try:
+        while True:
+            start = clock()
+            try:
+                pair = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed += clock() - start
+            count += 1
+            yield pair
+    finally:
+        fetcher_stats.iterated(count, elapsed)
+
+
+_instrumented_classes = {}
+
+
+def instrumented_class(cls):
+    instrumented = _instrumented_classes.get(cls)
+    if instrumented is None:
+        class instrumented(cls):
+            def do_request(self, request):
+                start = time.perf_counter()
+                try:
+                    return super().do_request(request)
+                finally:
+                    self.fetcher_stats.requested(time.perf_counter() - start)
+
+            def __iter__(self):
+                return _timed(iter(super().__iter__()), self.fetcher_stats)
+
+            def _changed(self, appended=None):
+                self.fetcher_stats.notified(appended)
+                super()._changed(appended)
+
+        instrumented.__name__ = instrumented.__qualname__ = cls.__name__
+        _instrumented_classes[cls] = instrumented
+    return instrumented
+
+
+class Stats:
+    def __init__(self):
+        self.fetchers = []
+        self.request_start = None
+        self.latencies = {'first': [], 'last': []}
+        self.frame_pending = False
+        self.request_frames = []
+        # (counter, time in microseconds) of the last frame following a results change, and frame times in milliseconds.
+        self.last_frame = None
+        self.frame_times = []
+
+    def instrument(self, fetcher, label='Root'):
+        "Instrument `fetcher` and everything upstream of it."
+        fetcher.__class__ = instrumented_class(type(fetcher))
+        fetcher.fetcher_stats = FetcherStats(f'{label}: {type(fetcher).__name__}')
+        fetcher.stats_label = label
+        self.fetchers.append(fetcher.fetcher_stats)
+        if getattr(fetcher, 'fetcher', None) is not None:
+            self.instrument(fetcher.fetcher, label)
+        for upstream in getattr(fetcher, 'fetchers', ()):
+            self.instrument(upstream, f'{label}/{upstream.name}')
+
+    def instrument_built(self, deferred):
+        "Instrument the fetcher a base.FetcherDeferred just built, if the deferred fetcher itself was, to be passed to its load()."
+        if hasattr(deferred, 'fetcher_stats'):
+            self.instrument(deferred.fetcher, deferred.stats_label)
+
+    def new_request(self):
+        self.close_request()
+        self.request_start = time.perf_counter()
+
+    def close_request(self):
+        for fetcher_stats in self.fetchers:
+            fetcher_stats.close()
+        if self.request_frames:
+            self.latencies['first'].append(self.request_frames[0])
+            self.latencies['last'].append(self.request_frames[-1])
+        self.request_frames = []
+
+    def results_changed(self, widget):
+        "Called when `widget` shows new results: the latency is measured up to the frame after that."
+        if self.request_start is not None and not self.frame_pending:
+            self.frame_pending = True
+            widget.add_tick_callback(self.tick_cb)
+
+    def tick_cb(self, widget, frame_clock):
+        self.frame_pending = False
+        self.request_frames.append((time.perf_counter() - self.request_start) * 1000)
+        counter = frame_clock.get_frame_counter()
+        frame_time = frame_clock.get_frame_time()
+        if self.last_frame is not None and self.last_frame[0] == counter - 1:
+            self.frame_times.append((frame_time - self.last_frame[1]) / 1000)
+        self.last_frame = counter, frame_time
+        return False
+
+    def format(self, samples):
+        if not samples:
+            return '-'
+        samples = sorted(samples)
+        return ' '.join(f'p{p}={percentile(samples, p):.3g}' for p in PERCENTILES) + f' max={samples[-1]:.3g}'
+
+    def dump(self):
+        self.close_request()
+        logger.info(f'Keystroke to results frame (ms), first: {self.format(self.latencies["first"])}')
+        logger.info(f'Keystroke to results frame (ms), last: {self.format(self.latencies["last"])}')
+        logger.info(f'Frame time while results change (ms): {self.format(self.frame_times)}')
+        for fetcher_stats in self.fetchers:
+            requests = len(fetcher_stats.samples['request_ms'])
+            if requests:
+                logger.info(f'{fetcher_stats.label} ({requests} requests)')
+                for field, samples in fetcher_stats.samples.items():
+                    logger.info(f'    {field}: {self.format(samples)}')
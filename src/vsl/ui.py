@@ -18,12 +18,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from gi.repository import GLib
 from gi.repository import GObject
 from gi.repository import Gio
 from gi.repository import Gdk
 from gi.repository import Gtk
 
 import re
+import difflib
+import collections
 
 from . import logger
 from . import items
@@ -70,13 +73,65 @@ class ItemBox(Gtk.Box):
         box3.append(self.score)
 
 
+class IconCache:
+    "Bounded LRU of the Gio.Icon to display for item icons: named ones get symbolic variants, and encoded ones are decoded."
+
+    def __init__(self, size=256):
+        self.size = size
+        self.icons = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(icon):
+        if isinstance(icon, str):
+            return icon
+        elif isinstance(icon, Gio.ThemedIcon):
+            return tuple(icon.get_names())
+        elif isinstance(icon, items.IconData):
+            return icon.data
+        else:
+            return None
+
+    @staticmethod
+    def resolve(icon):
+        if isinstance(icon, str):
+            return Gio.ThemedIcon(name=icon + '-symbolic')
+        elif isinstance(icon, items.IconData):
+            try:
+                return Gdk.Texture.new_from_bytes(GLib.Bytes.new(icon.data))
+            except GLib.Error as error:
+                logger.debug(f'Cannot decode icon: {error}')
+                return Gio.ThemedIcon(name='image-missing')
+        else:
+            names = icon.get_names()
+            return Gio.ThemedIcon.new_from_names([name + '-symbolic' for name in names] + names)
+
+    def lookup(self, icon):
+        key = self.key(icon)
+        if key is None:
+            return icon
+        resolved = self.icons.get(key)
+        if resolved is not None:
+            self.hits += 1
+            self.icons.move_to_end(key)
+            return resolved
+        self.misses += 1
+        resolved = self.icons[key] = self.resolve(icon)
+        if len(self.icons) > self.size:
+            self.icons.popitem(last=False)
+        logger.debug(f'Icon cache miss for {key if isinstance(key, (str, tuple)) else "icon data"}: {self.hits} hits, {self.misses} misses')
+        return resolved
+
+
 class Factory(Gtk.SignalListItemFactory):
     def __init__(self):
         super().__init__()
+        self.icon_cache = IconCache()
 
         self.connect('setup', self.setup_cb)
         self.connect('bind', self.bind_cb)
-        # self.connect('unbind', self.unbind_cb)
+        self.connect('unbind', self.unbind_cb)
         self.connect('teardown', self.teardown_cb)
 
     @staticmethod
@@ -90,22 +145,16 @@ class Factory(Gtk.SignalListItemFactory):
         box = listitem.get_child()
         box.title.set_label(item.format_title())
         box.detail.set_label(item.detail)
-        box.score.set_label(f"({scored_item.score})")
-
-        if item.icon is None:
-            return
-        elif isinstance(item.icon, str):
-            icon = Gio.ThemedIcon(name=item.icon + '-symbolic')
-        elif isinstance(item.icon, Gio.ThemedIcon):
-            names = item.icon.get_names()
-            icon = Gio.ThemedIcon.new_from_names([name + '-symbolic' for name in names] + names)
-        else:
-            icon = item.icon
-        box.icon.set_from_gicon(icon)
+        box.score_binding = scored_item.bind_property('score', box.score, 'label', GObject.BindingFlags.SYNC_CREATE, lambda binding, score: f"({score})")
 
-    # @staticmethod
-    # def unbind_cb(self, listitem):
-    #     pass
+        if item.icon is not None:
+            box.icon.set_from_gicon(self.icon_cache.lookup(item.icon))
+
+    @staticmethod
+    def unbind_cb(self, listitem):
+        box = listitem.get_child()
+        box.score_binding.unbind()
+        box.score_binding = None
 
     @staticmethod
     def teardown_cb(self, listitem):
@@ -113,6 +162,8 @@ class Factory(Gtk.SignalListItemFactory):
 
 
 class ScoredItem(GObject.Object):
+    score = GObject.Property(type=float)
+
     def __init__(self, item, score):
         super().__init__()
         self.item = item
@@ -120,6 +171,10 @@ class ScoredItem(GObject.Object):
 
 
 class RequestBox(Gtk.Box):
+    # A stats.Stats, when collecting statistics, and a replay.Recorder, when recording.
+    stats = None
+    recorder = None
+
     def __init__(self, fetcher):
         super().__init__(orientation=Gtk.Orientation.VERTICAL)
 
@@ -142,8 +197,22 @@ class RequestBox(Gtk.Box):
     def cleanup(self):
         del self.fetcher
 
-    def fetcher_changed(self):
-        self.store[:] = [ScoredItem(item, score) for item, score in self.fetcher]
+    def fetcher_changed(self, appended=None):
+        # Only splice the positions that changed, so that Gtk keeps the rows of the items still there.
+        new = list(self.fetcher)
+        old = [scored_item.item for scored_item in self.store]
+        scored_items = {scored_item.item: scored_item for scored_item in self.store}
+        opcodes = difflib.SequenceMatcher(None, old, [item for item, score in new], autojunk=False).get_opcodes()
+        for opcode, i1, i2, j1, j2 in reversed(opcodes):
+            if opcode != 'equal':
+                self.store.splice(i1, i2 - i1, [scored_items.get(item) or ScoredItem(item, score) for item, score in new[j1:j2]])
+        for scored_item, (item, score) in zip(self.store, new):
+            if scored_item.score != score:
+                scored_item.score = score
+        if self.stats is not None:
+            self.stats.results_changed(self)
+        if self.recorder is not None:
+            self.recorder.results(new)
 
     @staticmethod
     def activate_item(item, entry):
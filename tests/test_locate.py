@@ -0,0 +1,50 @@
+# coding: utf-8
+#
+# Very Simple Launcher
+#
+# Copyright (C) Itaï BEN YAACOV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import os
+
+import pytest
+
+pytest.importorskip('gi')
+
+from vsl import items
+from vsl.fetchers import base
+from vsl.fetchers import misc
+
+
+def leaf(fetcher):
+    while not isinstance(fetcher, base.FetcherColumnLeaf):
+        fetcher = fetcher.fetcher
+    return fetcher
+
+
+def test_classify_paths(tmp_path):
+    plain = tmp_path / 'notes.tex'
+    plain.write_text('')
+    locate = misc.FetcherLocate()
+    try:
+        assert leaf(locate).classify_paths(['/bin/sh', str(tmp_path), str(plain)]) == [
+            ('sh', items.ItemExecutable, leaf(locate).EXECUTABLE_BONUS),
+            (os.path.basename(tmp_path) + '/', items.ItemFolder, 0.0),
+            ('notes.tex', items.ItemFile, 0.0),
+        ]
+    finally:
+        locate.cleanup()
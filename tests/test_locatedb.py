@@ -0,0 +1,111 @@
+# coding: utf-8
+#
+# Very Simple Launcher
+#
+# Copyright (C) Itaï BEN YAACOV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import os
+import random
+
+import pytest
+
+pytest.importorskip('gi')
+
+from vsl.fetchers import locatedb
+
+
+NAMES = ('src', 'lib', 'Home', 'user', 'share', 'doc', 'icons', 'config', 'Configuration', 'python3', 'Été', 'notes.tex', 'README', 'a b')
+
+REQUESTS = ('conf', 'CONF', 'lib/py', 'share/doc', 'été', 'e/c', '/', 'x', 'notes.tex', 'zzz', 'a b')
+
+
+def tree(seed=0, count=300):
+    "(directory, [(name, is directory)...]) pairs, in the order updatedb would write them."
+    generator = random.Random(seed)
+    directories = {'/': set()}
+    for i in range(count):
+        path = '/' + '/'.join(generator.choice(NAMES) for i in range(generator.randint(1, 5)))
+        parts = path.split('/')[1:]
+        for depth in range(len(parts)):
+            parent = '/' + '/'.join(parts[:depth])
+            directories.setdefault(parent, set()).add((parts[depth], depth < len(parts) - 1))
+            if depth < len(parts) - 1:
+                directories.setdefault('/' + '/'.join(parts[:depth + 1]), set())
+    return [(directory, sorted(entries)) for directory, entries in sorted(directories.items())]
+
+
+def tree_paths(directories):
+    return [directory.rstrip('/') + '/' + name for directory, entries in directories for name, is_directory in entries]
+
+
+@pytest.fixture(params=['mlocate', 'locate02'])
+def database(request, tmp_path):
+    directories = tree()
+    paths = tree_paths(directories)
+    path = tmp_path / 'locate.db'
+    if request.param == 'mlocate':
+        locatedb.write_mlocate(path, directories)
+    else:
+        locatedb.write_locate02(path, sorted(paths))
+        paths = sorted(paths)
+    database = locatedb.LocateDatabase(path)
+    yield database, paths
+    database.close()
+
+
+def test_paths(database):
+    database, paths = database
+    assert list(database) == paths
+
+
+@pytest.mark.parametrize('request_', REQUESTS)
+def test_search(database, request_):
+    database, paths = database
+    assert list(database.search(request_)) == [path for path in paths if request_.lower() in path.lower()]
+
+
+def test_search_limit(database):
+    database, paths = database
+    assert list(database.search('o', 5)) == [path for path in paths if 'o' in path][:5]
+
+
+def test_long_prefix_change(tmp_path):
+    "Prefix length changes beyond a signed byte are stored on two bytes."
+    paths = ['/' + 'a' * 300 + '/b', '/' + 'a' * 300 + '/c', '/d']
+    path = tmp_path / 'locate.db'
+    locatedb.write_locate02(path, paths)
+    assert list(locatedb.LocateDatabase(path)) == paths
+
+
+def test_not_a_database(tmp_path):
+    path = tmp_path / 'locate.db'
+    path.write_bytes(b'\0plocate' + bytes(100))
+    with pytest.raises(ValueError):
+        locatedb.LocateDatabase(path)
+
+
+def test_stale(tmp_path):
+    path = tmp_path / 'locate.db'
+    locatedb.write_locate02(path, ['/a'])
+    database = locatedb.LocateDatabase(path)
+    assert not database.is_stale()
+    # As updatedb does, replace the file by renaming a new one over it.
+    locatedb.write_locate02(tmp_path / 'new.db', ['/a', '/b'])
+    os.replace(tmp_path / 'new.db', path)
+    assert database.is_stale()
+    assert list(locatedb.LocateDatabase(path)) == ['/a', '/b']
@@ -0,0 +1,66 @@
+# coding: utf-8
+#
+# Very Simple Launcher
+#
+# Copyright (C) Itaï BEN YAACOV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import os
+import random
+
+import pytest
+
+pytest.importorskip('gi')
+
+from vsl.fetchers import locateindex
+
+
+WORDS = ('src', 'lib', 'Home', 'user', 'share', 'doc', 'icons', 'config', 'Configuration', 'python3', 'Été', 'notes.tex')
+
+
+def paths(count, seed=0):
+    generator = random.Random(seed)
+    return ['/' + '/'.join(generator.choice(WORDS) for i in range(generator.randint(1, 6))) for i in range(count)]
+
+
+@pytest.mark.parametrize('request_', ['conf', 'lib/py', 'été', 'x', 'zzz', 'ho'])
+def test_search(tmp_path, request_):
+    located = paths(3 * locateindex.BLOCK_SIZE)
+    locateindex.build(tmp_path, map(os.fsencode, located))
+    index = locateindex.LocateIndex(tmp_path)
+    assert index.search(request_) == [path for path in located if request_ in path.lower()]
+    assert index.search(request_, 3) == [path for path in located if request_ in path.lower()][:3]
+
+
+def test_rebuild(tmp_path):
+    locateindex.build(tmp_path, map(os.fsencode, paths(100, 0)))
+    old = locateindex.LocateIndex(tmp_path)
+    before = old.search('o')
+    located = paths(100, 1)
+    locateindex.build(tmp_path, map(os.fsencode, located))
+    # The new files go together, the old ones are gone, and the old index still answers from its mappings.
+    assert sorted(name.split('.')[0] for name in os.listdir(tmp_path)) == ['blocks', 'lower', 'paths']
+    assert locateindex.LocateIndex(tmp_path).search('o') == [path for path in located if 'o' in path.lower()]
+    assert old.search('o') == before
+
+
+def test_truncated(tmp_path):
+    locateindex.build(tmp_path, map(os.fsencode, paths(100)))
+    blocks = tmp_path / 'blocks'
+    blocks.write_bytes(blocks.read_bytes()[:len(blocks.read_bytes()) // 2])
+    with pytest.raises(Exception):
+        locateindex.LocateIndex(tmp_path)
@@ -0,0 +1,73 @@
+# coding: utf-8
+#
+# Very Simple Launcher
+#
+# Copyright (C) Itaï BEN YAACOV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import random
+
+import pytest
+
+pytest.importorskip('gi')
+
+from vsl import items
+from vsl.fetchers import base
+
+
+APPLICATIONS = [
+    'Calculator', 'Terminal', 'Files', 'Document Viewer', 'Text Editor', 'Firefox', 'Settings', 'System Monitor',
+    'Software', 'Videos', 'Music', 'Image Viewer', 'Screenshot', 'Disks', 'Contacts', 'Calendar', 'Maps', 'Weather', 'Clocks', 'Characters',
+]
+
+SEQUENCES = ['the calculator', 'open terminal', 'my files', 'new document', 'zzzconfig', 'configuration', 'lib/python3', 'share/icons']
+
+WORDS = ('src', 'lib', 'home', 'user', 'share', 'doc', 'icons', 'config', 'configuration', 'python3', 'firefox', 'test', 'main', 'cache', 'local', 'README')
+
+
+@base.score
+class Leaf(base.FetcherLeaf):
+    def __init__(self, pairs):
+        super().__init__('Test', None)
+        self.append_items((items.ItemBase(name=name, detail=detail), 0.0) for name, detail in pairs)
+
+
+def applications():
+    return [(name, f'/usr/share/applications/{name.lower().replace(" ", "-")}.desktop') for name in APPLICATIONS]
+
+
+def paths(count):
+    generator = random.Random(0)
+    located = ['/' + '/'.join(generator.choice(WORDS) for i in range(generator.randint(2, 7))) for i in range(count)]
+    return [(path.rsplit('/', 1)[1], path) for path in located]
+
+
+def results(fetcher):
+    return [(item.name, item.detail, score) for item, score in fetcher]
+
+
+@pytest.mark.parametrize('pairs', [applications(), paths(3000)], ids=['applications', 'paths'])
+@pytest.mark.parametrize('sequence', SEQUENCES)
+def test_refined_matches_full(pairs, sequence):
+    "Typing `sequence` a character at a time, and backspacing, shows what scoring everything for each request shows."
+    typed = Leaf(pairs)
+    requests = [sequence[:i] for i in range(1, len(sequence) + 1)]
+    for request in requests + requests[-2::-1]:
+        typed.do_request(request)
+        full = Leaf(pairs)
+        full.do_request(request)
+        assert results(typed) == results(full), request
@@ -0,0 +1,106 @@
+# coding: utf-8
+#
+# Very Simple Launcher
+#
+# Copyright (C) Itaï BEN YAACOV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import configparser
+
+import pytest
+
+pytest.importorskip('gi')
+
+from vsl import fetchers
+from vsl import items
+from vsl import replay
+from vsl.fetchers import base
+
+
+CONFIG = '''
+[Root]
+type = mux
+
+[Root.mux]
+a = Apps
+f = Files
+
+[Apps]
+type = import
+import = .misc.FetcherLaunchApp
+
+[Files]
+type = import
+import = .misc.FetcherLocate
+'''
+
+SOURCES = {
+    'Apps': [('Terminal', '/usr/share/applications/terminal.desktop', 0.0), ('Text Editor', '/usr/share/applications/editor.desktop', 0.1)],
+    'Files': [('notes.tex', '/home/user/notes.tex', -0.1), ('terms.txt', '/home/user/terms.txt', 0.0), ('term', '/usr/bin/term', 0.1)],
+}
+
+REQUESTS = ['t', 'te', 'ter', 'term', '.', '.f', '.f te', '.a te', 'ed']
+
+
+@base.score
+class Leaf(base.FetcherLeaf):
+    def __init__(self, source):
+        super().__init__(source, None)
+        self.append_items((items.ItemDesktop(name=name, detail=detail) if source == 'Apps' else items.ItemBase(name=name, detail=detail), score) for name, detail, score in SOURCES[source])
+        self.append_items([(items.ItemNoop(name=f'{source} hint', detail=''), 0.0)])
+
+
+def config():
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read_string(CONFIG)
+    return parser
+
+
+def shown(root):
+    return [(item.format_title(), item.detail, score) for item, score in root]
+
+
+def test_stand_in_reproduces_results(tmp_path):
+    "Stand-ins built from a recording, in place of the imported fetchers of the configured tree, show what was recorded."
+    path = tmp_path / 'recording'
+    recorder = replay.Recorder(path)
+    root = fetchers.fetcher_from_config(config(), sources=recorder.sources, stand_in=Leaf)
+    recorded = []
+    try:
+        for request in REQUESTS:
+            recorder.request(request)
+            root.do_request(request)
+            recorder.results(list(root))
+            recorded.append(shown(root))
+    finally:
+        root.cleanup()
+        recorder.close()
+
+    recording, sources = replay.read_recording(path)
+    assert sorted(sources) == ['Apps', 'Files']
+    assert sources['Files'][('notes.tex', '/home/user/notes.tex')] == ('notes.tex', -0.1)
+    assert sources['Apps'][('Terminal', '/usr/share/applications/terminal.desktop')] == ('Terminal', 0.1)
+    assert sources['Apps'][('Apps hint', '')] == (None, 0.2)
+    assert [results for time_, request, results in recording] == [[(title, detail) for title, detail, score in results] for results in recorded]
+
+    root = fetchers.fetcher_from_config(config(), stand_in=lambda source: replay.StandInLeaf(source, sources[source]))
+    try:
+        for request, results in zip(REQUESTS, recorded):
+            root.do_request(request)
+            assert shown(root) == [(title, detail, pytest.approx(score)) for title, detail, score in results], request
+    finally:
+        root.cleanup()
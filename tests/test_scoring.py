@@ -0,0 +1,89 @@
+# coding: utf-8
+#
+# Very Simple Launcher
+#
+# Copyright (C) Itaï BEN YAACOV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import difflib
+import random
+
+import pytest
+
+pytest.importorskip('gi')
+
+from vsl import items
+from vsl import scoring
+
+
+def old_score(request, something):
+    "Scoring as ItemBase._score() did before Scorer."
+    if not request or not something:
+        return 0.0
+    opcodes = difflib.SequenceMatcher(None, request, something).get_opcodes()
+    n1 = [i2 - i1 for opcode, i1, i2, j1, j2 in opcodes if opcode in ('replace', 'delete')]
+    n2 = [j2 - j1 for opcode, i1, i2, j1, j2 in opcodes if opcode in ('replace', 'insert')]
+    score = 1.2
+    score -= 2 * sum(n1) / len(request) + len(n1) / 10
+    score -= sum(n2) / len(something) / len(request) + len(n2) / 20
+    return score
+
+
+WORDS = ('src', 'lib', 'home', 'user', 'share', 'doc', 'icons', 'config', 'configuration', 'python3', 'firefox', 'README', 'été', 'notes.tex')
+
+REQUESTS = ['', 'c', 'conf', 'config', 'lib/py', 'share/doc', 'été', 'xyz', 'aaaa', 'the calculator', 'ReadMe', 'e e e']
+
+
+def random_keys(count, generator):
+    alphabet = 'abcdeéz/. '
+    return [''.join(generator.choice(alphabet) for i in range(generator.randint(0, 30))) for i in range(count)]
+
+
+def path_keys(count, generator):
+    return ['/' + '/'.join(generator.choice(WORDS) for i in range(generator.randint(1, 8))) for i in range(count)]
+
+
+def long_keys(count, generator):
+    # Around and beyond SequenceMatcher's autojunk threshold.
+    return ['/'.join(generator.choice(WORDS) for i in range(generator.randint(25, 60)))[:generator.randint(190, 260)] for i in range(count)]
+
+
+@pytest.mark.parametrize('keys', [random_keys, path_keys, long_keys])
+@pytest.mark.parametrize('request_', REQUESTS)
+def test_scorer_parity(keys, request_):
+    generator = random.Random(request_)
+    keys = [key.lower() for key in keys(500, generator)]
+    scorer = scoring.Scorer(request_)
+    assert [scorer(key) for key in keys] == [old_score(request_.lower(), key) for key in keys]
+    # Memoized scores are the same.
+    assert [scorer(key) for key in keys] == [old_score(request_.lower(), key) for key in keys]
+
+
+def test_autojunk_boundary():
+    for length in range(195, 206):
+        key = ('config/' * 40)[:length]
+        for request_ in ('config', 'onfig/c', 'gifnoc'):
+            assert scoring.Scorer(request_)(key) == old_score(request_, key)
+
+
+@pytest.mark.parametrize('request_', REQUESTS)
+def test_score_items_parity(request_):
+    generator = random.Random(request_)
+    pairs = list(zip(path_keys(200, generator), random_keys(200, generator)))
+    scored = [items.ItemBase(name=name.upper(), detail=detail) for name, detail in pairs]
+    expected = [max(old_score(request_.lower(), name.lower()), old_score(request_.lower(), detail.lower()) - 0.05) for name, detail in pairs]
+    assert list(scoring.Scorer(request_).score_items(scored)) == expected
@@ -0,0 +1,104 @@
+# coding: utf-8
+#
+# Very Simple Launcher
+#
+# Copyright (C) Itaï BEN YAACOV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import asyncio
+import os
+import random
+
+import pytest
+
+pytest.importorskip('gi')
+
+from vsl import items
+from vsl import scoring
+from vsl.fetchers import base
+
+
+WORDS = ('src', 'lib', 'home', 'user', 'share', 'doc', 'icons', 'config', 'configuration', 'python3', 'notes.tex')
+
+
+@base.score
+class Leaf(base.FetcherColumnLeaf):
+    score_processes = 2
+
+    def make_item(self, name, detail, extra):
+        return items.ItemBase(name=name, detail=detail)
+
+
+def paths(count, seed=0):
+    generator = random.Random(seed)
+    return ['/' + '/'.join(generator.choice(WORDS) for i in range(generator.randint(1, 6))) for i in range(count)]
+
+
+def score_items(root):
+    fetcher = root
+    while not isinstance(fetcher, base.FetcherScoreItems):
+        fetcher = fetcher.fetcher
+    return fetcher
+
+
+async def settle(scorer):
+    while scorer.pool_task is not None:
+        await asyncio.sleep(0.01)
+
+
+def local_top(leaf, request):
+    "The top FetcherTop would show with scoring done locally, as (name, detail, score)."
+    scorer = scoring.Scorer(request)
+    scored = [(score + scorer.score_item(item), -index, item) for index, (item, score) in enumerate(leaf)]
+    return [(item.name, item.detail, score) for score, index, item in sorted(scored, reverse=True)[:10] if score >= 0.2]
+
+
+def test_pool_follows_updates():
+    async def run():
+        root = Leaf('Test', None)
+        scorer = score_items(root)
+        leaf = scorer.fetcher
+        shipped = []
+        updated = []
+        extend = scorer.pool.extend
+        update = scorer.pool.update
+        scorer.pool.extend = lambda rows: shipped.append(len(rows)) or extend(rows)
+        scorer.pool.update = lambda rows: updated.append(len(rows)) or update(rows)
+        try:
+            leaf.append_rows((os.path.basename(path), path, 0.0, None) for path in paths(1000))
+            root.do_request('conf')
+            await settle(scorer)
+            # Upgrading rows, as FetcherLocate does once it classified them, only ships what changed.
+            for index in range(0, 1000, 7):
+                leaf.rows.update(index, leaf.rows.names[index] + '/', leaf.rows.scores[index] + 0.1, None)
+            leaf.changed()
+            leaf.append_rows((os.path.basename(path), path, 0.0, None) for path in paths(10, seed=1))
+            await settle(scorer)
+            assert shipped == [1000, 10]
+            assert updated == [len(range(0, 1000, 7))]
+            assert [(item.name, item.detail, score) for item, score in root] == [(name, detail, pytest.approx(score * 0.8 ** i)) for i, (name, detail, score) in enumerate(local_top(leaf, 'conf'))]
+
+            # A new set of rows drops the candidates, until the pool answers for it.
+            leaf.clear()
+            assert list(root) == []
+            leaf.append_rows((os.path.basename(path), path, 0.0, None) for path in paths(100, seed=2))
+            await settle(scorer)
+            assert [item.detail for item, score in root] == [detail for name, detail, score in local_top(leaf, 'conf')]
+        finally:
+            root.cleanup()
+
+    asyncio.run(run())
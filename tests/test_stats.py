@@ -0,0 +1,69 @@
+# coding: utf-8
+#
+# Very Simple Launcher
+#
+# Copyright (C) Itaï BEN YAACOV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import pytest
+
+pytest.importorskip('gi')
+
+from vsl import stats
+
+
+class Widget:
+    def __init__(self):
+        self.callbacks = []
+
+    def add_tick_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def tick(self, counter, frame_time):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(self, Clock(counter, frame_time))
+
+
+class Clock:
+    def __init__(self, counter, frame_time):
+        self.counter = counter
+        self.frame_time = frame_time
+
+    def get_frame_counter(self):
+        return self.counter
+
+    def get_frame_time(self):
+        return self.frame_time
+
+
+def test_frame_times_under_churn():
+    "Only intervals between consecutive frames both following a results change count as frame times."
+    collected = stats.Stats()
+    widget = Widget()
+    collected.new_request()
+    for counter, frame_time in ((1, 0), (2, 16000), (5, 100000), (6, 133000)):
+        collected.results_changed(widget)
+        collected.results_changed(widget)
+        widget.tick(counter, frame_time)
+    # A frame without a results change breaks the sequence.
+    widget.tick(7, 150000)
+    collected.results_changed(widget)
+    widget.tick(8, 166000)
+    assert collected.frame_times == [16.0, 33.0]
+    collected.close_request()
+    assert len(collected.latencies['first']) == 1